@@ -0,0 +1,181 @@
+import random, time, json, sys, os, platform, argparse
+import poker, util, submission
+
+# Throughput benchmarks. Every benchmark draws its corpus of deals from a fixed
+# seed, so two runs measure the same work; run this file to get all of them as
+# JSON and, given a baseline from an earlier run, a list of regressions.
+
+OPPONENT_TYPES = ['TAG', 'LAG', 'TPA', 'LPA', 'RANDOM']
+STREETS = [('preflop', 0), ('flop', 3), ('turn', 4), ('river', 5)]
+
+# Return |numDeals| (hand, table cards) deals of 2 and 5 cards as card codes
+def dealCorpus(numDeals, seed):
+    random.seed(seed)
+    deck = poker.Deck(compact=True)
+    deals = []
+    for _ in xrange(numDeals):
+        deck.reset()
+        hand, other, tableCards = deck.dealHand()
+        deals.append((hand, tableCards))
+    return deals
+
+# Discards what is printed while it is active, such as util.simulate's progress
+class Quiet(object):
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+# Scores the same |numHands| random five-card hands with the original
+# pass-by-pass evaluator and with the lookup-table one, checks that they agree
+# and returns hands/sec for each.
+def benchmarkDetermineValue(numHands=100000, seed=0):
+    random.seed(seed)
+    deck = poker.Deck()
+    table = poker.Table(deck)
+    hands = [random.sample(deck.cards, 5) for _ in xrange(numHands)]
+
+    results = {}
+    values = {}
+    for name, evaluate in [('reference', table.referenceDetermineValue), ('lookup', table.determineValue)]:
+        copies = [list(hand) for hand in hands] #Both evaluators sort their argument in place
+        start = time.time()
+        values[name] = [evaluate(cards) for cards in copies]
+        results[name] = numHands / (time.time() - start)
+    if values['reference'] != values['lookup']:
+        raise Exception('Lookup evaluator disagrees with the reference evaluator')
+    return results
+
+# Returns Agent.assessHand hands/sec on each street, over the same deals
+def benchmarkAssessHand(numHands=50000, seed=0):
+    deals = dealCorpus(numHands, seed)
+    agent = poker.Agent()
+    results = {}
+    for street, numTableCards in STREETS:
+        tables = [tableCards[:numTableCards] for hand, tableCards in deals]
+        hands = [list(hand) for hand, tableCards in deals]
+        start = time.time()
+        for hand, tableCards in zip(hands, tables):
+            agent.hand = hand
+            agent.assessHand(tableCards)
+        results[street] = numHands / (time.time() - start)
+    return results
+
+# Returns pokerFeatureExtractor calls/sec on states of every street
+def benchmarkFeatureExtractor(numStates=20000, seed=0):
+    deals = dealCorpus(numStates, seed)
+    states = []
+    for i, (hand, tableCards) in enumerate(deals):
+        numTableCards = STREETS[i % len(STREETS)][1]
+        states.append((hand, tableCards[:numTableCards], 5 * (i % 7), ('Bet', 5 * (i % 4)), i % 4))
+    action = ('Bet', 5)
+    submission.handValueCache.clear() #Measure the cold cache, as at the start of training
+    start = time.time()
+    for state in states:
+        submission.pokerFeatureExtractor(state, action)
+    return numStates / (time.time() - start)
+
+# Return a subclass of the learner class |cls| that keeps the time spent in, and
+# number of calls to, incorporateFeedback
+def timedLearner(cls):
+    class TimedLearner(cls):
+        updateTime = 0
+        numUpdates = 0
+
+        def incorporateFeedback(self, state, action, reward, newState):
+            start = time.time()
+            cls.incorporateFeedback(self, state, action, reward, newState)
+            self.updateTime += time.time() - start
+            self.numUpdates += 1
+    return TimedLearner
+
+# Trains a |learner| (a key of submission.LEARNERS) against each opponent type for
+# |numTrials| hands. Returns util.simulate hands/sec per opponent type, and
+# incorporateFeedback updates/sec over all of them.
+def benchmarkSimulate(numTrials=2000, seed=0, learner='linear'):
+    learnerClass = timedLearner(submission.LEARNERS[learner])
+    results = {}
+    updateTime = 0
+    numUpdates = 0
+    for oppType in OPPONENT_TYPES:
+        random.seed(seed)
+        submission.handValueCache.clear()
+        deck = poker.Deck(compact=True)
+        mdp = util.pokerMDP(deck, oppType)
+        QL = learnerClass(mdp.actions, mdp.discount(), submission.cachedPokerFeatureExtractor(), 0.2)
+        with Quiet():
+            start = time.time()
+            util.simulate(mdp, QL, numTrials=numTrials, maxIterations=10000)
+            results[oppType] = numTrials / (time.time() - start)
+        updateTime += QL.updateTime
+        numUpdates += QL.numUpdates
+    return results, numUpdates / updateTime
+
+# Runs every benchmark; |scale| multiplies the size of each corpus, and the
+# learning benchmarks train a |learner|
+def runBenchmarks(scale=1.0, seed=0, learner='linear'):
+    size = lambda n: max(1, int(n * scale))
+    simulateResults, updateResults = benchmarkSimulate(size(2000), seed, learner)
+    return {
+        'python': platform.python_version(),
+        'seed': seed,
+        'scale': scale,
+        'learner': learner,
+        'results': {
+            'determineValue hands/sec': benchmarkDetermineValue(size(100000), seed),
+            'assessHand hands/sec': benchmarkAssessHand(size(50000), seed),
+            'pokerFeatureExtractor calls/sec': benchmarkFeatureExtractor(size(20000), seed),
+            'incorporateFeedback updates/sec': updateResults,
+            'simulate hands/sec': simulateResults,
+        }}
+
+# Flattens nested results into {'name/sub name': value}
+def flatten(results, prefix=''):
+    flat = {}
+    for name, value in results.iteritems():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + name + '/'))
+        else:
+            flat[prefix + name] = value
+    return flat
+
+# Return the (name, baseline, current) of every result more than |tolerance|
+# (a fraction) below its baseline. All results are rates, so lower is worse.
+def findRegressions(baseline, current, tolerance):
+    if baseline.get('learner', 'linear') != current['learner']:
+        raise Exception('Baseline trained %s, not %s' %(baseline.get('learner', 'linear'), current['learner']))
+    baseline = flatten(baseline['results'])
+    current = flatten(current['results'])
+    regressions = []
+    for name in sorted(current):
+        if name in baseline and current[name] < baseline[name] * (1 - tolerance):
+            regressions.append((name, baseline[name], current[name]))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure evaluator, feature and learner throughput.')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown that counts as a regression (default 0.2)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the size of every corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--learner', choices=submission.LEARNERS.keys(), default='linear',
+                        help='learner the learning benchmarks train (default linear)')
+    args = parser.parse_args()
+
+    report = runBenchmarks(args.scale, args.seed, args.learner)
+    for name, value in sorted(flatten(report['results']).iteritems()):
+        print '%-45s %12.0f' %(name, value)
+    if args.output:
+        with open(args.output, 'w') as outf:
+            json.dump(report, outf, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as inf:
+            regressions = findRegressions(json.load(inf), report, args.tolerance)
+        for name, before, after in regressions:
+            print 'REGRESSION %s: %.0f -> %.0f (%.0f%%)' %(name, before, after, 100.0 * (after - before) / before)
+        if regressions:
+            sys.exit(1)
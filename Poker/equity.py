@@ -0,0 +1,344 @@
+import math, random, itertools, os, struct, array, sys
+import poker, util
+try:
+    import numpy as np
+except ImportError:
+    np = None #Without numpy the estimator falls back to one assessCards call per hand
+
+# Hand equity against one random opponent hand: the chance of winning the
+# showdown plus half the chance of a tie, over the opponent's hole cards and the
+# rest of the board.
+
+# Showdown strength of a best hand as one int, so that comparing two of them
+# agrees with the showdown in util.pokerMDP: the determineValue value first, then
+# the five cards of the hand (as codes) from the highest down.
+def showdownKey(value, bestCards):
+    key = value
+    for card in bestCards:
+        key = (key << 6) | poker.CARD_CODES[card]
+    return key
+
+# Showdown key of the best hand a player holding |handCards| makes on |tableCards|
+def showdownScore(handCards, tableCards):
+    value, bestCards = poker.assessCards(list(handCards), list(tableCards))
+    return showdownKey(value, bestCards)
+
+# NumPy versions of the determineValue lookup tables, for scoring many hands at
+# once.  A 5-card hand with its cards sorted high to low is keyed by its ranks as
+# a 5-digit base-13 number, which indexes the tables directly: one for any hand,
+# one for flushes.  Built on first use.
+batchTables = None
+
+def getBatchTables():
+    global batchTables
+    if batchTables == None:
+        rankTable = np.zeros(13 ** 5, dtype=np.int64)
+        flushTable = np.zeros(13 ** 5, dtype=np.int64)
+        for ranks in itertools.combinations_with_replacement(xrange(14, 1, -1), 5):
+            key = 0
+            product = 1
+            for rank in ranks:
+                key = key * 13 + rank - 2
+                product *= poker.RANK_PRIMES[rank]
+            rankTable[key] = poker.rankValues[product]
+            if product in poker.flushValues:
+                flushTable[key] = poker.flushValues[product]
+        subsets = np.array(poker.FIVE_CARD_SUBSETS[7])
+        batchTables = (rankTable, flushTable, subsets)
+    return batchTables
+
+# Showdown keys of many 7-card hands at once: |cards| is an (n, 7) array of card
+# codes and the result an array of n keys, equal to what showdownScore gives.
+# Scores all 21 5-card subsets and keeps the first best one, as assessCards does.
+def batchShowdownScores(cards):
+    rankTable, flushTable, subsets = getBatchTables()
+    cards = -np.sort(-cards, axis=1) #High card first
+    subsetCards = cards[:, subsets] #(n, 21, 5)
+    ranks = subsetCards >> 2
+    keys = (((ranks[:, :, 0] * 13 + ranks[:, :, 1]) * 13 + ranks[:, :, 2]) * 13 + ranks[:, :, 3]) * 13 + ranks[:, :, 4]
+    suits = subsetCards & 3
+    flush = (suits == suits[:, :, :1]).all(axis=2)
+    values = np.where(flush, flushTable[keys], rankTable[keys])
+    best = values.argmax(axis=1) #First subset reaching the highest value
+    rows = np.arange(len(cards))
+    keys = values[rows, best]
+    for i in xrange(5):
+        keys = (keys << 6) | subsetCards[rows, best, i]
+    return keys
+
+# Positions of the |count| smallest keys of every row of |keys|, ordered by key.
+# With random keys that draws |count| cards per row; argpartition alone would
+# leave the drawn cards in an order that depends on the cards, and whether a card
+# goes to the board or to a hand would not be random.
+def smallestKeys(keys, count):
+    positions = keys.argpartition(count - 1, axis=1)[:, :count]
+    rows = np.arange(len(keys))[:, None]
+    return positions[rows, keys[rows, positions].argsort(axis=1)]
+
+# Draws |numSamples| opponent hands and runouts: returns the (n, 7) card codes of
+# the player's hands and of the opponent's, with the board shared.
+def sampleShowdowns(handCodes, tableCodes, remaining, numSamples):
+    needed = 2 + 5 - len(tableCodes)
+    drawn = remaining[smallestKeys(np.random.random_sample((numSamples, len(remaining))), needed)]
+    board = np.hstack([np.tile(np.array(tableCodes, dtype=np.int64), (numSamples, 1)), drawn[:, 2:]])
+    own = np.hstack([np.tile(np.array(handCodes, dtype=np.int64), (numSamples, 1)), board])
+    opp = np.hstack([drawn[:, :2], board])
+    return own, opp
+
+# Return the (wins, ties) of |numSamples| random showdowns
+def sampleOutcomes(handCodes, tableCodes, remaining, numSamples):
+    if np is not None:
+        own, opp = sampleShowdowns(handCodes, tableCodes, remaining, numSamples)
+        scores = batchShowdownScores(np.vstack([own, opp]))
+        ownScores = scores[:numSamples]
+        oppScores = scores[numSamples:]
+        return int((ownScores > oppScores).sum()), int((ownScores == oppScores).sum())
+    wins = 0
+    ties = 0
+    needed = 2 + 5 - len(tableCodes)
+    for _ in xrange(numSamples):
+        drawn = random.sample(remaining, needed)
+        board = tableCodes + drawn[2:]
+        own = showdownScore(handCodes, board)
+        opp = showdownScore(drawn[:2], board)
+        if own > opp:
+            wins += 1
+        elif own == opp:
+            ties += 1
+    return wins, ties
+
+# Monte Carlo equity of |handCards| on |tableCards| (0, 3, 4 or 5 cards) against a
+# random hand.  Samples in batches until the half-width of the |z|-sigma
+# confidence interval on the equity is at most |precision|, or |maxSamples| have
+# been drawn.  The first batch has |batchSize| samples, so a coarse query can stop
+# after a few hundred; each later one draws what the variance so far says is
+# still missing, but at most twice the previous batch.
+# Returns (win probability, tie probability, half-width, number of samples).
+def estimateEquity(handCards, tableCards, precision=0.01, z=1.96, batchSize=128, maxSamples=100000):
+    if len(handCards) != 2:
+        raise Exception('Need 2 cards not %s' %(len(handCards)))
+    if len(tableCards) not in (0, 3, 4, 5):
+        raise Exception('Invalid number of table cards %s' %(len(tableCards)))
+    handCodes = [poker.CARD_CODES[card] for card in handCards]
+    tableCodes = [poker.CARD_CODES[card] for card in tableCards]
+    known = poker.cardMask(handCodes + tableCodes)
+    remaining = [code for code in xrange(52) if not (known >> code) & 1]
+    if np is not None:
+        remaining = np.array(remaining, dtype=np.int64)
+
+    wins = 0
+    ties = 0
+    samples = 0
+    while True:
+        n = min(batchSize, maxSamples - samples)
+        batchWins, batchTies = sampleOutcomes(handCodes, tableCodes, remaining, n)
+        wins += batchWins
+        ties += batchTies
+        samples += n
+        # Each showdown scores 1, 0.5 or 0
+        mean = (wins + 0.5 * ties) / samples
+        variance = max((wins + 0.25 * ties) / samples - mean * mean, 0)
+        halfWidth = z * math.sqrt(variance / samples)
+        if halfWidth <= precision or samples >= maxSamples:
+            return (float(wins) / samples, float(ties) / samples, halfWidth, samples)
+        needed = int(math.ceil(variance * (z / precision) ** 2)) - samples
+        batchSize = max(1, min(2 * n, needed))
+
+# Exact equity.  Once the flop is out, every showdown is the table plus k = 7 -
+# len(table) cards drawn from the other cards: the player's two and the runout,
+# or the opponent's two and the same runout.  So a single array, holding the
+# showdown key of every k-card set of the unseen cards, scores both sides of every
+# showdown, whatever the player holds; each set is scored once even though it
+# comes up under many different runouts and opponent hands.  The arrays are
+# indexed by the colex rank of the set (sum of C(position i, i + 1) over its
+# sorted positions) and kept per table in an LRU cache, so a board's scores are
+# reused by every hand evaluated on it.
+BOARD_SCORE_CACHE_SIZE = 8
+boardScoreCache = util.LRUCache(BOARD_SCORE_CACHE_SIZE)
+binomials = None #binomials[n, k] = C(n, k) for n <= 52, k <= 4
+
+def getBinomials():
+    global binomials
+    if binomials is None:
+        binomials = np.zeros((53, 5), dtype=np.int64)
+        for n in xrange(53):
+            binomials[n, 0] = 1
+            for k in xrange(1, min(n, 4) + 1):
+                binomials[n, k] = binomials[n - 1, k - 1] + (binomials[n - 1, k] if k < n else 0)
+    return binomials
+
+# Colex ranks of the sets of positions along the last axis of |positions|, sorted ascending
+def colexRanks(positions):
+    binomials = getBinomials()
+    ranks = 0
+    for i in xrange(positions.shape[-1]):
+        ranks = ranks + binomials[positions[..., i], i + 1]
+    return ranks
+
+# Every |k|-subset of range(n) as a (C(n, k), k) array, in lexicographic order
+def positionCombinations(n, k):
+    combos = np.array(list(itertools.combinations(xrange(n), k)), dtype=np.int64)
+    return combos.reshape(-1, k) if k > 0 else np.zeros((1, 0), dtype=np.int64)
+
+# Return (unseen card codes, showdown key of every (7 - len(tableCodes))-card set
+# of them together with the table, by colex rank of their positions)
+def boardScores(tableCodes, chunkSize=20000):
+    key = poker.cardMask(tableCodes)
+    entry = boardScoreCache.get(key)
+    if entry == None:
+        unseen = np.array([code for code in xrange(52) if not (key >> code) & 1], dtype=np.int64)
+        k = 7 - len(tableCodes)
+        combos = positionCombinations(len(unseen), k)
+        table = np.tile(np.array(tableCodes, dtype=np.int64), (len(combos), 1))
+        cards = np.hstack([table, unseen[combos]])
+        scores = np.empty(len(combos), dtype=np.int64)
+        ranks = colexRanks(combos)
+        for start in xrange(0, len(combos), chunkSize):
+            scores[ranks[start:start + chunkSize]] = batchShowdownScores(cards[start:start + chunkSize])
+        entry = (unseen, scores)
+        boardScoreCache.put(key, entry)
+    return entry
+
+# Exact equity of |handCards| on |tableCards| (3, 4 or 5 cards) against a random
+# hand, over every runout and opponent hand.  Needs numpy.
+# Returns (win probability, tie probability).
+def exactEquity(handCards, tableCards):
+    if np is None:
+        raise Exception('exactEquity needs numpy')
+    if len(handCards) != 2:
+        raise Exception('Need 2 cards not %s' %(len(handCards)))
+    if len(tableCards) not in (3, 4, 5):
+        raise Exception('Invalid number of table cards %s' %(len(tableCards)))
+    tableCodes = [poker.CARD_CODES[card] for card in tableCards]
+    unseen, scores = boardScores(tableCodes)
+    handPositions = [int(np.searchsorted(unseen, poker.CARD_CODES[card])) for card in handCards]
+    others = np.array([i for i in xrange(len(unseen)) if i not in handPositions], dtype=np.int64)
+
+    needed = 5 - len(tableCodes)
+    runouts = others[positionCombinations(len(others), needed)]
+    pairs = others[positionCombinations(len(others), 2)]
+    own = np.sort(np.hstack([np.tile(handPositions, (len(runouts), 1)), runouts]), axis=1)
+    ownScores = scores[colexRanks(own)]
+
+    # Every opponent hand against every runout, dropping those sharing a card
+    combined = np.concatenate([np.broadcast_to(runouts[:, None, :], (len(runouts), len(pairs), needed)),
+                               np.broadcast_to(pairs[None, :, :], (len(runouts), len(pairs), 2))], axis=2)
+    valid = np.ones((len(runouts), len(pairs)), dtype=bool)
+    for i in xrange(needed):
+        valid &= (pairs[None, :, 0] != runouts[:, i, None]) & (pairs[None, :, 1] != runouts[:, i, None])
+    combined.sort(axis=2)
+    oppScores = scores[np.where(valid, colexRanks(combined), 0)] #A repeated card makes no valid rank
+    wins = ((ownScores[:, None] > oppScores) & valid).sum()
+    ties = ((ownScores[:, None] == oppScores) & valid).sum()
+    total = float(valid.sum())
+    return (wins / total, ties / total)
+
+# Pre-flop equity.  The 169 starting hand classes are the cells of a 13 x 13 grid
+# of ranks (0 for a 2 up to 12 for an Ace): pairs on the diagonal, suited hands at
+# [high][low] and offsuit hands at [low][high], so a class is high * 13 + low or
+# low * 13 + high.  The table holds the equity of every class against every class,
+# averaged over the concrete hands of the two classes that don't share a card, and
+# of every class against a random hand.  The showdown's last tie-break is the
+# suit, so the hands of a class differ slightly and the table has their average.
+# buildPreflopEquities estimates them once; preflopEquity loads the saved table
+# on first use.
+PREFLOP_EQUITY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preflop_equity.bin')
+PREFLOP_EQUITY_MAGIC = 'PFE\x00'
+PREFLOP_EQUITY_VERSION = 1
+PREFLOP_EQUITY_HEADER = struct.Struct('<4sII') #Magic, version, samples per class pair
+NUM_HAND_CLASSES = 169
+preflopEquities = None #(class vs class, class vs random hand) once loaded
+
+def handClass(handCards):
+    first, second = [poker.CARD_CODES[card] for card in handCards]
+    high = max(first >> 2, second >> 2)
+    low = min(first >> 2, second >> 2)
+    if (first & 3) == (second & 3):
+        return high * 13 + low
+    return low * 13 + high
+
+# Every concrete hand of every class, as a list of (card code, card code) per class
+def classHands():
+    hands = [[] for _ in xrange(NUM_HAND_CLASSES)]
+    for first, second in itertools.combinations(xrange(52), 2):
+        hands[handClass([first, second])].append((first, second))
+    return hands
+
+# Return the equity of a random hand of class |first| against one of class
+# |second| (a random hand if None) over |numSamples| random deals
+def sampleClassEquity(hands, first, second, numSamples):
+    own = np.array(hands[first], dtype=np.int64)[np.random.randint(len(hands[first]), size=numSamples)]
+    if second == None:
+        opp = np.zeros((numSamples, 0), dtype=np.int64)
+    else:
+        opp = np.array(hands[second], dtype=np.int64)[np.random.randint(len(hands[second]), size=numSamples)]
+        shared = (own[:, :1] == opp) | (own[:, 1:] == opp)
+        keep = ~shared.any(axis=1)
+        own = own[keep]
+        opp = opp[keep]
+    # Draw the rest of the deal from the cards the hands leave
+    rows = np.arange(len(own))[:, None]
+    keys = np.random.random_sample((len(own), 52))
+    keys[rows, own] = 2
+    keys[rows, opp] = 2
+    drawn = smallestKeys(keys, 7 - opp.shape[1])
+    if second == None:
+        opp = drawn[:, 5:]
+    board = drawn[:, :5]
+    scores = batchShowdownScores(np.vstack([np.hstack([own, board]), np.hstack([opp, board])]))
+    ownScores = scores[:len(own)]
+    oppScores = scores[len(own):]
+    return ((ownScores > oppScores).sum() + 0.5 * (ownScores == oppScores).sum()) / len(own)
+
+# Estimates the pre-flop equity table with |numSamples| deals per class pair (and
+# 10 times as many per class against a random hand) and saves it to |fileName|.
+# The same |seed| always builds the same table.
+def buildPreflopEquities(numSamples=2000, fileName=PREFLOP_EQUITY_FILE, seed=0):
+    if np is None:
+        raise Exception('buildPreflopEquities needs numpy')
+    np.random.seed(seed)
+    hands = classHands()
+    versus = array.array('f', [0.0] * (NUM_HAND_CLASSES * NUM_HAND_CLASSES))
+    for first in xrange(NUM_HAND_CLASSES):
+        versus[first * NUM_HAND_CLASSES + first] = 0.5
+        for second in xrange(first + 1, NUM_HAND_CLASSES):
+            value = sampleClassEquity(hands, first, second, numSamples)
+            versus[first * NUM_HAND_CLASSES + second] = value
+            versus[second * NUM_HAND_CLASSES + first] = 1 - value
+    versusRandom = array.array('f', [sampleClassEquity(hands, c, None, 10 * numSamples) for c in xrange(NUM_HAND_CLASSES)])
+    if sys.byteorder != 'little':
+        versus.byteswap()
+        versusRandom.byteswap()
+    with open(fileName, 'wb') as outf:
+        outf.write(PREFLOP_EQUITY_HEADER.pack(PREFLOP_EQUITY_MAGIC, PREFLOP_EQUITY_VERSION, numSamples))
+        versus.tofile(outf)
+        versusRandom.tofile(outf)
+
+def loadPreflopEquities(fileName=PREFLOP_EQUITY_FILE):
+    with open(fileName, 'rb') as inf:
+        data = inf.read()
+    magic, version, numSamples = PREFLOP_EQUITY_HEADER.unpack_from(data)
+    if magic != PREFLOP_EQUITY_MAGIC or version != PREFLOP_EQUITY_VERSION:
+        raise Exception('%s is not a version %d pre-flop equity file' %(fileName, PREFLOP_EQUITY_VERSION))
+    values = array.array('f')
+    values.fromstring(data[PREFLOP_EQUITY_HEADER.size:])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    size = NUM_HAND_CLASSES * NUM_HAND_CLASSES
+    if len(values) != size + NUM_HAND_CLASSES:
+        raise Exception('%s is truncated' %fileName)
+    return (values[:size], values[size:])
+
+# Pre-flop equity of |handCards| against |oppCards|, or against a random hand
+def preflopEquity(handCards, oppCards=None):
+    global preflopEquities
+    if preflopEquities == None:
+        preflopEquities = loadPreflopEquities()
+    versus, versusRandom = preflopEquities
+    if oppCards == None:
+        return versusRandom[handClass(handCards)]
+    return versus[handClass(handCards) * NUM_HAND_CLASSES + handClass(oppCards)]
+
+if __name__ == '__main__':
+    buildPreflopEquities()
+    print 'Saved pre-flop equities to %s' %PREFLOP_EQUITY_FILE
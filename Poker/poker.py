@@ -4,27 +4,114 @@ import collections, math, random, itertools, operator
 #
 ##########################################
 
+# Compact card encoding. Besides (rank, suit) tuples a card can be the int
+# (rank - 2) * 4 + suit index, 0-51, and a set of cards the 52-bit mask with bit
+# |code| set. The suit indices follow the alphabetical order of the suit names, so
+# codes sort exactly like the tuples do: sorting, max() and the best-hand tie-breaks
+# give the same answers with either form.
+CODE_SUITS = ["Clubs", "Diamonds", "Hearts", "Spades"]
+RANK_PRIMES = [0, 0, 2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41] #Indexed by rank
+
+def cardCode(card):
+  if isinstance(card, tuple):
+    return (card[0] - 2) * 4 + CODE_SUITS.index(card[1])
+  return card
+
+def codeCard(code):
+  return ((code >> 2) + 2, CODE_SUITS[code & 3])
+
+# Readable (rank, suit) tuples for cards in either form; use before printing
+def readableCards(cards):
+  return [codeCard(cardCode(card)) for card in cards]
+
+def cardMask(cards):
+  mask = 0
+  for card in cards:
+    mask |= 1 << CARD_CODES[card]
+  return mask
+
+def maskCards(mask):
+  return [code for code in xrange(52) if (mask >> code) & 1]
+
+# Suit isomorphism. Cards that only differ by a relabelling of the suits
+# (hearts for spades, say) make the same hand values, so caches of them can
+# treat them as one. Returns |mask| (a cardMask) with its suits relabelled into
+# canonical order: with codes (rank-2)*4 + suit, the ranks of suit s are the bits
+# of (mask >> s) & SUIT_RANK_BITS; sorting those four, largest first, and putting
+# them back as suits 0 to 3 gives the same mask for every relabelling.
+SUIT_RANK_BITS = sum(1 << (4 * rank) for rank in xrange(13))
+def canonicalMask(mask):
+  a, b, c, d = sorted((mask & SUIT_RANK_BITS, (mask >> 1) & SUIT_RANK_BITS,
+                       (mask >> 2) & SUIT_RANK_BITS, (mask >> 3) & SUIT_RANK_BITS), reverse=True)
+  return a | (b << 1) | (c << 2) | (d << 3)
+
+# Per-card lookups keyed by both forms, so the evaluators accept either
+CARD_CODES = {}
+CARD_RANKS = {}
+CARD_SUITS = {} #Suit index into CODE_SUITS
+CARD_PRIMES = {}
+for code in xrange(52):
+  for card in (code, codeCard(code)):
+    CARD_CODES[card] = code
+    CARD_RANKS[card] = (code >> 2) + 2
+    CARD_SUITS[card] = code & 3
+    CARD_PRIMES[card] = RANK_PRIMES[(code >> 2) + 2]
+
 class Deck(object):
     """docstring for Deck"""
     testDeckSize = 6 #Deck of cards 2 - 6
     fullDeckSize = 14 #Deck of cards 2 - 14, 14 being an Ace
 
-    def __init__(self, ranksize = fullDeckSize):
+    # The cards live in one preallocated list for the life of the deck; |position|
+    # is the next card to deal, so everything before it has already been dealt.
+    def __init__(self, ranksize = fullDeckSize, compact = False):
         suits = ["Hearts", "Spades", "Diamonds", "Clubs"]
+        self.compact = compact #Deal int codes instead of (rank, suit) tuples
+        self.ranksize = ranksize
         self.cards = [(x, y) for x in range(2, ranksize + 1) for y in suits] #First is value, second is suit
-        self.cardCount = 4*ranksize
+        if compact:
+            self.cards = [cardCode(card) for card in self.cards]
+        self.position = 0
+        self.cardCount = len(self.cards)
 
+    # Shuffles the undealt cards in place (Fisher-Yates, as random.shuffle does)
     def shuffle(self):
-        random.shuffle(self.cards)
-
-    def reset(self, ranksize = fullDeckSize):
-        suits = ["Hearts", "Spades", "Diamonds", "Clubs"]
-        self.cards = [(x, y) for x in range(2, ranksize + 1) for y in suits] #First is value, second is suit
-        self.cardCount = 4*ranksize
+        cards = self.cards
+        start = self.position
+        for i in reversed(xrange(start + 1, len(cards))):
+            j = start + int(random.random() * (i - start + 1))
+            cards[i], cards[j] = cards[j], cards[i]
+
+    # Puts every card back and reshuffles, reusing the same list. Without
+    # |shuffle| the cards keep their order, for callers that shuffle themselves.
+    def reset(self, ranksize = fullDeckSize, shuffle = True):
+        if ranksize != self.ranksize:
+            self.__init__(ranksize, self.compact)
+        self.position = 0
+        self.cardCount = len(self.cards)
+        if shuffle:
+            self.shuffle()
 
     def draw(self):
+        card = self.cards[self.position]
+        self.position += 1
         self.cardCount -= 1
-        return self.cards.pop(0)
+        return card
+
+    def remainingCards(self):
+        return self.cards[self.position:]
+
+    # Deals a whole hand at once: two cards to each player, alternating as
+    # Table.dealPlayers does, then the five table cards.
+    # Returns (firstPlayerHand, secondPlayerHand, tableCards).
+    def dealHand(self):
+        start = self.position
+        if start + 9 > len(self.cards):
+            raise Exception('Need 9 cards not %s' %(len(self.cards) - start))
+        cards = self.cards
+        self.position += 9
+        self.cardCount -= 9
+        return [cards[start], cards[start + 2]], [cards[start + 1], cards[start + 3]], cards[start + 4:start + 9]
 
 class Table(object):
     
@@ -86,6 +173,14 @@ class Table(object):
         return
 
     def determineValue(self, cards):
+        if len(cards) > 5:
+            raise Exception('Need 5 cards not %s' %(len(cards)))
+        cards.sort(reverse=True) #Put high card first
+        return lookupValue(cards)
+
+    #Original pass-by-pass evaluator, for (rank, suit) tuples only. The lookup tables
+    #used by determineValue are built from it, and benchmark.py measures against it.
+    def referenceDetermineValue(self, cards):
         if len(cards) > 5:
             raise Exception('Need 5 cards not %s' %(len(cards)))
         cards.sort()
@@ -207,7 +302,118 @@ class Table(object):
         result = pair(cards)
         if result[0]: return self.pairReward + result[1][0]
         else: return cards[0][0]
-        
+
+# Lookup tables behind Table.determineValue. A multiset of ranks is keyed by the
+# product of one prime per card, so scoring a hand takes a few multiplications and
+# a single dict lookup. Flushes get their own table since only suits tell them apart.
+
+def buildValueTables():
+  suits = ["Hearts", "Spades", "Diamonds", "Clubs"]
+  table = Table(None)
+  rankValues = {}
+  flushValues = {}
+  for size in xrange(1, 6):
+    #Includes impossible multisets too: duplicate cards do reach the evaluator from
+    #the chance-node enumeration in util.pokerMDP
+    for ranks in itertools.combinations_with_replacement(xrange(2, 15), size):
+      key = 1
+      for rank in ranks:
+        key *= RANK_PRIMES[rank]
+      #Equal ranks are adjacent, so cycling through the suits never builds a flush
+      rankValues[key] = table.referenceDetermineValue([(rank, suits[i % 4]) for i, rank in enumerate(ranks)])
+      if size == 5:
+        flushValues[key] = table.referenceDetermineValue([(rank, suits[0]) for rank in ranks])
+  return rankValues, flushValues
+
+rankValues, flushValues = buildValueTables()
+
+# Scores up to 5 cards; same values as Table.determineValue but leaves |cards| untouched
+def lookupValue(cards):
+  key = 1
+  for card in cards:
+    key *= CARD_PRIMES[card]
+  if len(cards) == 5:
+    suit = CARD_SUITS[cards[0]]
+    if CARD_SUITS[cards[1]] == suit and CARD_SUITS[cards[2]] == suit and CARD_SUITS[cards[3]] == suit \
+        and CARD_SUITS[cards[4]] == suit:
+      return flushValues[key]
+  return rankValues[key]
+
+# Index sets of every 5-card subset of 6 or 7 cards, in lexicographic order. Over
+# cards sorted high to low, the first subset reaching the best value is also the
+# highest such hand, which is the tie-break assessHand has always used.
+FIVE_CARD_SUBSETS = dict((n, list(itertools.combinations(xrange(n), 5))) for n in (6, 7))
+
+# Best value of a player's hand given the table, along with the five cards making it.
+# Shared by Agent.assessHand and Opponent.assessHand.
+def assessCards(handCards, tableCards):
+  # pre-flop
+  if len(tableCards) == 0:
+    handCards.sort(reverse=True)
+    return (lookupValue(handCards), handCards)
+
+  cards = handCards + tableCards
+  cards.sort(reverse=True)
+  # at flop
+  if len(cards) <= 5:
+    return (lookupValue(cards), cards)
+
+  # at turn and river: score every 5-card subset in a single pass
+  primes = [CARD_PRIMES[card] for card in cards]
+  suits = [CARD_SUITS[card] for card in cards]
+  flushSuit = None
+  for suit in suits[:len(cards) - 4]: #Five cards of one suit must include one of these
+    if suits.count(suit) >= 5:
+      flushSuit = suit
+  bestValue = -1
+  bestSubset = None
+  for subset in FIVE_CARD_SUBSETS[len(cards)]:
+    a, b, c, d, e = subset
+    key = primes[a] * primes[b] * primes[c] * primes[d] * primes[e]
+    if flushSuit is not None and suits[a] == flushSuit and suits[b] == flushSuit and suits[c] == flushSuit \
+        and suits[d] == flushSuit and suits[e] == flushSuit:
+      value = flushValues[key]
+    else:
+      value = rankValues[key]
+    if value > bestValue:
+      bestValue = value
+      bestSubset = subset
+  return (bestValue, [cards[i] for i in bestSubset])
+
+# Starting hand classes of Opponent.identifyStartHandRank, strongest first, as
+# (higher rank, lower rank, suited). Pairs are never suited; every hand not
+# listed has rank 8.
+START_HAND_CLASSES = [
+  [(14, 14, False), (13, 13, False), (12, 12, False), (11, 11, False), (14, 13, True)],
+  [(10, 10, False), (14, 12, True), (14, 11, True), (13, 12, True), (14, 13, False)],
+  [(9, 9, False), (14, 10, True), (13, 11, True), (12, 11, True), (11, 10, True), (14, 12, False)],
+  [(8, 8, False), (13, 10, True), (12, 10, True), (11, 9, True), (10, 9, True), (9, 8, True),
+    (14, 11, False), (13, 12, False)],
+  [(7, 7, False), (14, 9, True), (14, 8, True), (14, 7, True), (14, 6, True), (14, 5, True),
+    (14, 4, True), (14, 3, True), (14, 2, True), (12, 9, True), (10, 8, True), (9, 7, True),
+    (8, 7, True), (7, 6, True), (13, 11, False), (12, 11, False), (11, 10, False)],
+  [(6, 6, False), (5, 5, False), (13, 9, True), (11, 8, True), (8, 6, True), (7, 5, True),
+    (5, 4, True), (14, 10, False), (13, 10, False), (12, 10, False)],
+  [(4, 4, False), (3, 3, False), (2, 2, False), (13, 8, True), (13, 7, True), (13, 6, True),
+    (13, 5, True), (13, 4, True), (13, 3, True), (13, 2, True), (12, 8, True), (10, 7, True),
+    (6, 4, True), (5, 3, True), (4, 3, True), (11, 9, False), (10, 9, False), (9, 8, False)]]
+
+# Rank of every ordered pair of card codes, at index 52 * first + second
+def buildStartHandRanks():
+  classRanks = {}
+  for rank, hands in enumerate(START_HAND_CLASSES):
+    for hand in hands:
+      classRanks[hand] = rank + 1
+  ranks = []
+  for first in xrange(52):
+    for second in xrange(52):
+      high = max(CARD_RANKS[first], CARD_RANKS[second])
+      low = min(CARD_RANKS[first], CARD_RANKS[second])
+      ranks.append(classRanks.get((high, low, CARD_SUITS[first] == CARD_SUITS[second]), 8))
+  return ranks
+
+START_HAND_RANKS = buildStartHandRanks()
+
 class Agent(object):
     def __init__(self):
         self.hand = []
@@ -217,66 +423,56 @@ class Agent(object):
         self.hand.append(tuple)
 
     def assessHand(self, tableCards):
-        bestHand = []
-
-        # pre-flop
-        if len(tableCards)==0:
-            bestHand = self.hand
-            #print '2 from hand, 0 from table'
-            return (t.determineValue(bestHand), bestHand)
-
-        # at flop
-        if len(tableCards)==3:
-            bestHand = self.hand + tableCards
-            #print '2 from hand, 3 from table'
-            return (t.determineValue(bestHand), bestHand)
-
-        # at turn (4th card)
-        if len(tableCards)==4:
-            combValues = []
-            for i in xrange(1,len(self.hand)+1):
-                #print '%s from hand, %s from table' %(i, 5-i)
-                for handCombination in itertools.combinations(self.hand, i):
-                    for tableCombination in itertools.combinations(tableCards, len(tableCards)-i+1):
-                        #print tableCombination
-                        bestHand = list(handCombination) + list(tableCombination)
-                        #print bestHand
-                        combValues.append((t.determineValue(bestHand), bestHand))
-            #print combValues
-            # sort list by value and get all the hands resulting in an equivalent max value
-            combValues = sorted(combValues, reverse=True)
-            result = [combi for combi in combValues if combi[0] == combValues[0][0]]
-            # sort list by best hand
-            result = sorted(result, key= lambda var: var[1], reverse=True)
-            return result[0]
-
-        #at river
-        if len(tableCards)==5:
-            combValues = []
-          # taking into account player hand
-            for i in xrange(1,len(self.hand)+1):
-                #print '%s from hand, %s from table' %(i, 5-i)
-                for handCombination in itertools.combinations(self.hand, i):
-                    for tableCombination in itertools.combinations(tableCards, len(tableCards)-i): 
-                        #print tableCombination
-                        bestHand = list(handCombination) + list(tableCombination)
-                        #print bestHand
-                        combValues.append((t.determineValue(bestHand), bestHand))
-          # only looking at table cards
-            #print '0 from hand, 5 from table'
-            bestHand = tableCards
-            #print bestHand
-            combValues.append((t.determineValue(bestHand), bestHand))
-            # sort list by value and get all the hands resulting in an equivalent max value
-            # print [item[0] for item in combValues]
-            combValues = sorted(combValues, reverse=True)
-            # print [item[0] for item in combValues]
-            result = [combi for combi in combValues if combi[0] == combValues[0][0]]
-            # sort list by best hand
-            result = sorted(result, key= lambda var: var[1], reverse=True)
-            #print result
-            # return first item in sorted list: one with the best 
-            return result[0]
+        return assessCards(self.hand, tableCards)
+
+# Parameters of the fixed-policy opponents, one profile per opponent type; a new
+# kind of opponent only needs an entry here. Lists indexed by starting hand rank
+# - 1 (initial*) or by Opponent.determineValIndex (game*).
+#   bettingFrequency: probability of opening with a bet on a weak hand
+#   betsStrongHands: always open with a bet on a strong hand after the flop
+#   maxRank: never open with a bet pre-flop on a starting hand of this rank or worse
+OPPONENT_PROFILES = {
+  'TAG': { #Will rarely play, and often bet
+    'bettingFrequency': 0.8,
+    'betsStrongHands': True,
+    'maxRank': None,
+    'initialFoldProb': [0, 0, 0, 0, 0.05, 0.1, 0.15, 0.2],
+    'initialHandBets': [15, 10, 5, 5, 5, 0, 0, 0], #Cash willing to initally bet
+    'maxInitialBet': [15, 15, 10, 10, 5, 5, 5, 5], #Cash willing to max bet
+    'gameFoldProb': [0.2, 0.1, 0.05, 0, 0, 0, 0, 0, 0, 0], #Probability of folding given a hand
+    'gameBets': [0, 0, 0, 5, 5, 10, 15, 15, 15, 15], #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
+    'maxGameBets': [0, 5, 5, 10, 10, 15, 15, 15, 15, 15]},
+  'LAG': { #Will always play, and often bet
+    'bettingFrequency': 0.8,
+    'betsStrongHands': False,
+    'maxRank': None,
+    'initialFoldProb': [0, 0, 0, 0, 0, 0, 0, 0],
+    'initialHandBets': [15, 10, 5, 5, 5, 0, 0, 0], #Cash willing to initally bet
+    'maxInitialBet': [15, 15, 10, 5, 5, 0, 0, 0], #Percentage of initial cash willing to max bet
+    'gameFoldProb': [0.05, 0.01, 0, 0, 0, 0, 0, 0, 0, 0],
+    'gameBets': [0, 0, 0, 5, 5, 10, 15, 15, 15, 15], #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
+    'maxGameBets': [0, 0, 5, 10, 10, 15, 15, 15, 15, 15]},
+  'TPA': { #Will rarely play, and rarely bet
+    'bettingFrequency': 0.1,
+    'betsStrongHands': True,
+    'maxRank': 7,
+    'initialFoldProb': [0, 0, 0, 0, 0.05, 0.1, 0.15, 0.2],
+    'initialHandBets': [10, 5, 5, 5, 0, 0, 0, 0], #Cash willing to initally bet
+    'maxInitialBet': [10, 10, 10, 5, 5, 5, 0, 0], #Percentage of initial cash willing to max bet
+    'gameFoldProb': [0.2, 0.1, 0.05, 0, 0, 0, 0, 0, 0, 0],
+    'gameBets': [0, 0, 0, 5, 5, 5, 5, 5, 10, 15], #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
+    'maxGameBets': [0, 0, 5, 5, 10, 15, 15, 15, 15, 15]},
+  'LPA': { #Will always play, and rarely initiate a bet
+    'bettingFrequency': 0.1,
+    'betsStrongHands': False,
+    'maxRank': 7,
+    'initialFoldProb': [0, 0, 0, 0, 0, 0, 0, 0],
+    'initialHandBets': [10, 5, 5, 5, 0, 0, 0, 0], #Cash willing to initally bet
+    'maxInitialBet': [15, 15, 15, 15, 15, 15, 15, 15], #Percentage of initial cash willing to max bet
+    'gameFoldProb': [0.05, 0.01, 0, 0, 0, 0, 0, 0, 0, 0],
+    'gameBets': [0, 0, 0, 5, 5, 5, 5, 5, 10, 15], #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
+    'maxGameBets': [15, 15, 15, 15, 15, 15, 15, 15, 15, 15]},
+}
 
 class Opponent(object):
     def __init__(self, opponentType):
@@ -284,40 +480,11 @@ class Opponent(object):
         self.opponentType = opponentType
         self.roundBet = 0
         self.betExploreProb = 0.2
-        if opponentType == 'TAG': #Will rarely play, and often bet
-          self.bettingFrequency = 0.8
-          self.initialFoldProb = [0, 0, 0, 0, 0.05, 0.1, 0.15, 0.2]
-          self.initialHandBets = [15, 10, 5, 5, 5, 0, 0, 0] #Cash willing to initally bet
-          self.maxInitialBet = [15, 15, 10, 10, 5, 5, 5, 5] #Cash willing to max bet
-          self.gameFoldProb = [0.2, 0.1, 0.05, 0, 0, 0, 0, 0, 0, 0] #Probability of folding given a hand
-          self.gameBets = [0, 0, 0, 5, 5, 10, 15, 15, 15, 15] #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
-          self.maxGameBets = [0, 5, 5, 10, 10, 15, 15, 15, 15, 15]
-        elif opponentType == 'LAG': #Will always play, and often bet
-          self.bettingFrequency = 0.8
-          self.initialFoldProb = [0, 0, 0, 0, 0, 0, 0, 0]
-          self.initialHandBets = [15, 10, 5, 5, 5, 0, 0, 0] #Cash willing to initally bet
-          self.maxInitialBet = [15, 15, 10, 5, 5, 0, 0, 0] #Percentage of initial cash willing to max bet
-          self.gameFoldProb = [0.05, 0.01, 0, 0, 0, 0, 0, 0, 0, 0]
-          self.gameBets = [0, 0, 0, 5, 5, 10, 15, 15, 15, 15] #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
-          self.maxGameBets = [0, 0, 5, 10, 10, 15, 15, 15, 15, 15]
-        elif opponentType == 'TPA': #Will rarely play, and rarely bet
-          self.bettingFrequency = 0.1
-          self.maxRank = 7
-          self.initialFoldProb = [0, 0, 0, 0, 0.05, 0.1, 0.15, 0.2]
-          self.initialHandBets = [10, 5, 5, 5, 0, 0, 0, 0] #Cash willing to initally bet
-          self.maxInitialBet = [10, 10, 10, 5, 5, 5, 0, 0] #Percentage of initial cash willing to max bet
-          self.gameFoldProb = [0.2, 0.1, 0.05, 0, 0, 0, 0, 0, 0, 0]
-          self.gameBets = [0, 0, 0, 5, 5, 5, 5, 5, 10, 15] #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
-          self.maxGameBets = [0, 0, 5, 5, 10, 15, 15, 15, 15, 15]
-        elif opponentType == 'LPA': #Will always play, and rarely initiate a bet
-          self.bettingFrequency = 0.1
-          self.maxRank = 7
-          self.initialFoldProb = [0, 0, 0, 0, 0, 0, 0, 0]
-          self.initialHandBets = [10, 5, 5, 5, 0, 0, 0, 0] #Cash willing to initally bet
-          self.maxInitialBet = [15, 15, 15, 15, 15, 15, 15, 15] #Percentage of initial cash willing to max bet
-          self.gameFoldProb = [0.05, 0.01, 0, 0, 0, 0, 0, 0, 0, 0]
-          self.gameBets = [0, 0, 0, 5, 5, 5, 5, 5, 10, 15] #Nothing, pair, 2P, 3K, straight, flush, fullHouse, 4K, straight flush, royal flush
-          self.maxGameBets = [15, 15, 15, 15, 15, 15, 15, 15, 15, 15]
+        self.analysisKey = None
+        self.analysis = None
+        if opponentType in OPPONENT_PROFILES:
+          for name, value in OPPONENT_PROFILES[opponentType].iteritems():
+            setattr(self, name, list(value) if isinstance(value, list) else value) #Own copy of the profile lists
         # 'RANDOM' is also a type of opponent with all random actions
     def receiveCard(self, tuple):
         self.hand.append(tuple)
@@ -325,122 +492,10 @@ class Opponent(object):
     def identifyStartHandRank(self, handCards):
       if len(handCards) != 2:
         raise Exception('Need 2 cards not %s' %(len(handCards)))
-
-      rank1 = [[(14, 'off'), (14, 'off')], [(13, 'off'), (13, 'off')], [(12, 'off'), (12, 'off')],
-                [(11, 'off'), (11, 'off')], [(14, 'same'), (13, 'same')]]
-      rank2 = [[(10, 'off'), (10, 'off')], [(14, 'same'), (12, 'same')], [(14, 'same'), (11, 'same')],
-                [(13, 'same'), (12, 'same')], [(14, 'off'), (13, 'off')]]
-      rank3 = [[(9, 'off'), (9, 'off')], [(14, 'same'), (10, 'same')], [(13, 'same'), (11, 'same')],
-                [(12, 'same'), (11, 'same')], [(11, 'same'), (10, 'same')], [(14, 'off'), (12, 'off')]]
-      rank4 = [[(8, 'off'), (8, 'off')], [(13, 'same'), (10, 'same')], [(12, 'same'), (10, 'same')],
-                [(11, 'same'), (9, 'same')], [(10, 'same'), (9, 'same')], [(9, 'same'), (8, 'same')],
-                [(14, 'off'), (11, 'off')], [(13, 'off'), (12, 'off')]]
-      rank5 = [[(7, 'off'), (7, 'off')], [(14, 'same'), (9, 'same')], [(14, 'same'), (8, 'same')],
-                [(14, 'same'), (7, 'same')], [(14, 'same'), (6, 'same')], [(14, 'same'), (5, 'same')],
-                [(14, 'same'), (4, 'same')], [(14, 'same'), (3, 'same')], [(14, 'same'), (2, 'same')],
-                [(12, 'same'), (9, 'same')], [(10, 'same'), (8, 'same')], [(9, 'same'), (7, 'same')],
-                [(8, 'same'), (7, 'same')], [(7, 'same'), (6, 'same')], [(13, 'off'), (11, 'off')],
-                [(12, 'off'), (11, 'off')], [(11, 'off'), (10, 'off')]]
-      rank6 = [[(6, 'off'), (6, 'off')], [(5, 'off'), (5, 'off')], [(13, 'same'), (9, 'same')],
-                [(11, 'same'), (8, 'same')], [(8, 'same'), (6, 'same')], [(7, 'same'), (5, 'same')],
-                [(5, 'same'), (4, 'same')], [(14, 'off'), (10, 'off')], [(13, 'off'), (10, 'off')],
-                [(12, 'off'), (10, 'off')]]
-      rank7 = [[(4, 'off'), (4, 'off')], [(3, 'off'), (3, 'off')], [(2, 'off'), (2, 'off')], 
-                [(13, 'same'), (8, 'same')], [(13, 'same'), (7, 'same')], [(13, 'same'), (6, 'same')], [(13, 'same'), (5, 'same')],
-                [(13, 'same'), (4, 'same')], [(13, 'same'), (3, 'same')], [(13, 'same'), (2, 'same')],
-                [(12, 'same'), (8, 'same')], [(10, 'same'), (7, 'same')], [(6, 'same'), (4, 'same')],
-                [(5, 'same'), (3, 'same')], [(4, 'same'), (3, 'same')], [(11, 'off'), (9, 'off')],
-                [(10, 'off'), (9, 'off')], [(9, 'off'), (8, 'off')]]
-      # 'rank8' is everything else
-      
-      simpleCards = [[None, 'off'], [None, 'off']]
-      if handCards[0][1] == handCards[1][1]:
-        simpleCards[0][1] = 'same'
-        simpleCards[1][1] = 'same'
-
-      topValue = max(handCards)
-      botValue = min(handCards)
-      simpleCards[0][0] = topValue[0]
-      simpleCards[1][0] = botValue[0]
-      tupleCards = [tuple(simpleCards[0]), tuple(simpleCards[1])]
-
-      if tupleCards in rank1:
-        return 1
-      elif tupleCards in rank2:
-        return 2
-      elif tupleCards in rank3:
-        return 3
-      elif tupleCards in rank4:
-        return 4
-      elif tupleCards in rank5:
-        return 5
-      elif tupleCards in rank6:
-        return 6
-      elif tupleCards in rank7:
-        return 7
-      return 8 #End of identifyStartHandRank
+      return START_HAND_RANKS[CARD_CODES[handCards[0]] * 52 + CARD_CODES[handCards[1]]]
 
     def assessHand(self, tableCards):
-        bestHand = []
-
-        # pre-flop
-        if len(tableCards)==0:
-            bestHand = self.hand
-            #print '2 from hand, 0 from table'
-            return (t.determineValue(bestHand), bestHand)
-
-        # at flop
-        if len(tableCards)==3:
-            bestHand = self.hand + tableCards
-            #print '2 from hand, 3 from table'
-            return (t.determineValue(bestHand), bestHand)
-
-        # at turn (4th card)
-        if len(tableCards)==4:
-            combValues = []
-            for i in xrange(1,len(self.hand)+1):
-                #print '%s from hand, %s from table' %(i, 5-i)
-                for handCombination in itertools.combinations(self.hand, i):
-                    for tableCombination in itertools.combinations(tableCards, len(tableCards)-i+1):
-                        #print tableCombination
-                        bestHand = list(handCombination) + list(tableCombination)
-                        #print bestHand
-                        combValues.append((t.determineValue(bestHand), bestHand))
-            #print combValues
-            # sort list by value and get all the hands resulting in an equivalent max value
-            combValues = sorted(combValues, reverse=True)
-            result = [combi for combi in combValues if combi[0] == combValues[0][0]]
-            # sort list by best hand
-            result = sorted(result, key= lambda var: var[1], reverse=True)
-            return result[0]
-
-        #at river
-        if len(tableCards)==5:
-            combValues = []
-          # taking into account player hand
-            for i in xrange(1,len(self.hand)+1):
-                #print '%s from hand, %s from table' %(i, 5-i)
-                for handCombination in itertools.combinations(self.hand, i):
-                    for tableCombination in itertools.combinations(tableCards, len(tableCards)-i): 
-                        #print tableCombination
-                        bestHand = list(handCombination) + list(tableCombination)
-                        #print bestHand
-                        combValues.append((t.determineValue(bestHand), bestHand))
-          # only looking at table cards
-            #print '0 from hand, 5 from table'
-            bestHand = tableCards
-            #print bestHand
-            combValues.append((t.determineValue(bestHand), bestHand))
-            # sort list by value and get all the hands resulting in an equivalent max value
-            # print [item[0] for item in combValues]
-            combValues = sorted(combValues, reverse=True)
-            # print [item[0] for item in combValues]
-            result = [combi for combi in combValues if combi[0] == combValues[0][0]]
-            # sort list by best hand
-            result = sorted(result, key= lambda var: var[1], reverse=True)
-            #print result
-            # return first item in sorted list: one with the best 
-            return result[0]
+        return assessCards(self.hand, tableCards)
 
     def determineBet(self, normBet):
           if normBet == 0:
@@ -492,213 +547,29 @@ class Opponent(object):
             return 9 #Royal Flush
         return 0 #Nothing
 
-    def determineTAGPolicy(self, handCards, tableCards, oppPastAction):
-      #oppPastAction: Touple of past action and amount to stay in at the pot, (None, 0) if first
-      #Actions: (Fold, 0), (Bet, 0), (Bet, 5), (Bet, 10), (Bet, 15)
-      if len(handCards) != 2:
-        raise Exception('Hand needs 2 cards not %s' %(len(handCards)))
-
-      #print oppPastAction
-      oppAction = oppPastAction[0]
-      currPhaseBet = oppPastAction[1]
-
-      if oppAction == 'Fold': #Game is over; agent gave up
-        return ('Fold', 0)
-
-      if len(tableCards) == 0: #Pre-flop
-        handRank = self.identifyStartHandRank(handCards)
-        if oppAction == None:
-          if random.random() < self.initialFoldProb[handRank - 1]: #Decreasing chance as rank goes up
-            return ('Fold', 0)
-          #Otherwise; see how we will normally bet
-          normBet = self.initialHandBets[handRank-1]
-          #Will weight neighboring bets with 0.2 probability
-          #So if amount is 15 or 0; probability of betting 15/0 is 0.8
-          #If amount is 5, for instance though, will bet 5 with 0.6 prob, 0 with 0.2 prob, and 10 with 0.2 prob
-          #Use the determineBet function to handle these cases
-          return self.determineBet(normBet)
-        elif oppAction == 'Bet':
-          if self.maxInitialBet[handRank-1] < currPhaseBet: #Fold if we would bet too much
-            if random.random() < self.initialFoldProb[handRank - 1]:
-              return ('Fold', 0)
-          return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 3: #Flop
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-        #print value
-
-        #print index
-
-        haveStraight = straightAfterFlop(handCards, tableCards)
-        haveFlush = flushAfterFlop(handCards, tableCards)
-
-        if oppAction == None:
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Fantastic chance of winning! Good shot at Straight/flush or greater - be very agressive
-            #Go on - Bet!
-            normBet = self.gameBets[index]
-            return self.determineBet(normBet)
-          else:
-            #Should we 'explore' with a bet??
-            if random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 4 or len(tableCards) == 5: #Turn and River turns
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-
-        haveStraight = straightAfterTurn(handCards, tableCards)
-        haveFlush = flushAfterTurn(handCards, tableCards)
-
-        if oppAction == None:
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Fantastic chance of winning! Be agressive
-            normBet = self.gameBets[index]
-            return self.determineBet(normBet)
-          else:
-            if (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1):
-              #Too much risk: Don't bet
-              return ('Bet', 0)
-            #Should we 'explore' with a bet??
-            elif random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          elif (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1): 
-            #Too much risk, abort
-            return ('Fold', 0)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      print handCards
-      print tableCards
-      print oppPastAction
-      return (None, None) #Error if this reaches here
-
-    def determineLAGPolicy(self, handCards, tableCards, oppPastAction):
-            #oppPastAction: Touple of past action and amount to stay in at the pot, (None, 0) if first
-      #Actions: (Fold, 0), (Bet, 0), (Bet, 5), (Bet, 10), (Bet, 15)
-      if len(handCards) != 2:
-        raise Exception('Hand needs 2 cards not %s' %(len(handCards)))
-
-      #print oppPastAction
-      oppAction = oppPastAction[0]
-      currPhaseBet = oppPastAction[1]
-
-      if oppAction == 'Fold': #Game is over; agent gave up
-        return ('Fold', 0)
-
-      if len(tableCards) == 0: #Pre-flop
-        handRank = self.identifyStartHandRank(handCards)
-        if oppAction == None:
-          if random.random() < self.initialFoldProb[handRank - 1]: #Decreasing chance as rank goes up
-            return ('Fold', 0)
-          #Otherwise; see how we will normally bet
-          normBet = self.initialHandBets[handRank-1]
-          #Will weight neighboring bets with 0.2 probability
-          #So if amount is 15 or 0; probability of betting 15/0 is 0.8
-          #If amount is 5, for instance though, will bet 5 with 0.6 prob, 0 with 0.2 prob, and 10 with 0.2 prob
-          #Use the determineBet function to handle these cases
-          return self.determineBet(normBet)
-        elif oppAction == 'Bet':
-          if self.maxInitialBet[handRank-1] < currPhaseBet: #Fold if we would bet too much
-            if random.random() < self.initialFoldProb[handRank - 1]:
-              return ('Fold', 0)
-          return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 3: #Flop
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-
-        haveStraight = straightAfterFlop(handCards, tableCards)
-        haveFlush = flushAfterFlop(handCards, tableCards)
-
-        if oppAction == None:
-            #Should we 'explore' with a bet??
-            if random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 4 or len(tableCards) == 5: #Turn and River turns
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-
-        haveStraight = straightAfterTurn(handCards, tableCards)
-        haveFlush = flushAfterTurn(handCards, tableCards)
-
-        if oppAction == None:
-            if (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1):
-              #Too much risk: Don't bet
-              return ('Bet', 0)
-            #Should we 'explore' with a bet??
-            elif random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          elif (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1): 
-            #Too much risk, abort
-            return ('Fold', 0)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      print handCards
-      print tableCards
-      print oppPastAction
-      return (None, None) #Error if this reaches here
+    # Return (value index, straight draw, flush draw) for the hand and table, as
+    # determineValIndex and straightAfterTurn / flushAfterTurn give them (the
+    # flop versions on the flop). Both players act up to twice per round, so the
+    # analysis of the current cards is kept until the table changes.
+    def analyzeHand(self, handCards, tableCards):
+      key = (cardMask(handCards), cardMask(tableCards), len(tableCards))
+      if key != self.analysisKey:
+        index = self.determineValIndex(self.assessHand(tableCards)[0])
+        if len(tableCards) == 3:
+          self.analysis = (index, straightAfterFlop(handCards, tableCards), flushAfterFlop(handCards, tableCards))
+        else:
+          self.analysis = (index, straightAfterTurn(handCards, tableCards), flushAfterTurn(handCards, tableCards))
+        self.analysisKey = key
+      return self.analysis
 
-    def determineTPAPolicy(self, handCards, tableCards, oppPastAction):
+    # Policy of the fixed-policy opponents, driven by the parameters of their
+    # OPPONENT_PROFILES entry.
+    def determineProfilePolicy(self, handCards, tableCards, oppPastAction):
       #oppPastAction: Touple of past action and amount to stay in at the pot, (None, 0) if first
       #Actions: (Fold, 0), (Bet, 0), (Bet, 5), (Bet, 10), (Bet, 15)
       if len(handCards) != 2:
         raise Exception('Hand needs 2 cards not %s' %(len(handCards)))
 
-      #print oppPastAction
       oppAction = oppPastAction[0]
       currPhaseBet = oppPastAction[1]
 
@@ -711,7 +582,7 @@ class Opponent(object):
           if random.random() < self.initialFoldProb[handRank - 1]: #Decreasing chance as rank goes up
             return ('Fold', 0)
           #If rank is too high, don't bet if we stay in
-          if handRank >= self.maxRank:
+          if self.maxRank != None and handRank >= self.maxRank:
             return ('Bet', 0)
           #Otherwise; see how we will normally bet
           normBet = self.initialHandBets[handRank-1]
@@ -728,175 +599,36 @@ class Opponent(object):
         else: #Invalid oppAction
           raise Exception('Invalid oppAction %s' %oppAction)
 
-      if len(tableCards) == 3: #Flop
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-        #print value
-
-        #print index
-
-        haveStraight = straightAfterFlop(handCards, tableCards)
-        haveFlush = flushAfterFlop(handCards, tableCards)
-
-        if oppAction == None:
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Fantastic chance of winning! Good shot at Straight/flush or greater - be very agressive
-            #Go on - Bet!
-            normBet = self.gameBets[index]
-            return self.determineBet(normBet)
-          else:
-            #Should we 'explore' with a bet??
-            if random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 4 or len(tableCards) == 5: #Turn and River turns
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-
-        haveStraight = straightAfterTurn(handCards, tableCards)
-        haveFlush = flushAfterTurn(handCards, tableCards)
-
-        if oppAction == None:
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Fantastic chance of winning! Be agressive
-            normBet = self.gameBets[index]
-            return self.determineBet(normBet)
-          else:
-            if (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1):
-              #Too much risk: Don't bet
-              return ('Bet', 0)
-            #Should we 'explore' with a bet??
-            elif random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          elif (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1): 
-            #Too much risk, abort
-            return ('Fold', 0)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      print handCards
-      print tableCards
-      print oppPastAction
-      return (None, None) #Error if this reaches here
-
-    def determineLPAPolicy(self, handCards, tableCards, oppPastAction):
-            #oppPastAction: Touple of past action and amount to stay in at the pot, (None, 0) if first
-      #Actions: (Fold, 0), (Bet, 0), (Bet, 5), (Bet, 10), (Bet, 15)
-      if len(handCards) != 2:
-        raise Exception('Hand needs 2 cards not %s' %(len(handCards)))
-
-      #print oppPastAction
-      oppAction = oppPastAction[0]
-      currPhaseBet = oppPastAction[1]
-
-      if oppAction == 'Fold': #Game is over; agent gave up
-        return ('Fold', 0)
-
-      if len(tableCards) == 0: #Pre-flop
-        handRank = self.identifyStartHandRank(handCards)
-        if oppAction == None:
-          if random.random() < self.initialFoldProb[handRank - 1]: #Decreasing chance as rank goes up
-            return ('Fold', 0)
-          #If rank is too high, don't bet if we stay in
-          if handRank >= self.maxRank:
-            return ('Bet', 0)
-          #Otherwise; see how we will normally bet
-          normBet = self.initialHandBets[handRank-1]
-          #Will weight neighboring bets with 0.2 probability
-          #So if amount is 15 or 0; probability of betting 15/0 is 0.8
-          #If amount is 5, for instance though, will bet 5 with 0.6 prob, 0 with 0.2 prob, and 10 with 0.2 prob
-          #Use the determineBet function to handle these cases
-          return self.determineBet(normBet)
-        elif oppAction == 'Bet':
-          if self.maxInitialBet[handRank-1] < currPhaseBet: #Fold if we would bet too much
-            if random.random() < self.initialFoldProb[handRank - 1]:
+      if len(tableCards) < 3 or len(tableCards) > 5:
+        raise Exception('Invalid number of table cards %s' %(len(tableCards)))
+
+      #Flop, turn and river. The flop draws are True/False, never -1, so there is no risk yet
+      index, haveStraight, haveFlush = self.analyzeHand(handCards, tableCards)
+      strong = index > 4 or haveFlush == 1 or haveStraight == 1 #Good shot at Straight/flush or greater
+      risky = (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1)
+
+      if oppAction == None:
+        if strong and self.betsStrongHands: #Fantastic chance of winning! Be agressive
+          return self.determineBet(self.gameBets[index])
+        elif risky: #Too much risk: Don't bet
+          return ('Bet', 0)
+        #Should we 'explore' with a bet??
+        elif random.random() < self.bettingFrequency: #Raise this turn
+          return self.determineBet(self.gameBets[index])
+        else: #Continue, but don't bet
+          return ('Bet', 0)
+      elif oppAction == 'Bet':
+        if strong: #Good chance of winning - match whatever agent wants!
+          return ('Bet', currPhaseBet)
+        elif risky: #Too much risk, abort
+          return ('Fold', 0)
+        else: #Less odds of winning
+          if self.maxGameBets[index] < currPhaseBet: #Would bet too much
+            if random.random() < self.gameFoldProb[index]:
               return ('Fold', 0)
           return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 3: #Flop
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-
-        haveStraight = straightAfterFlop(handCards, tableCards)
-        haveFlush = flushAfterFlop(handCards, tableCards)
-
-        if oppAction == None:
-            #Should we 'explore' with a bet??
-            if random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      if len(tableCards) == 4 or len(tableCards) == 5: #Turn and River turns
-        value = self.assessHand(tableCards)[0]
-        index = self.determineValIndex(value)
-
-        haveStraight = straightAfterTurn(handCards, tableCards)
-        haveFlush = flushAfterTurn(handCards, tableCards)
-
-        if oppAction == None:
-            if (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1):
-              #Too much risk: Don't bet
-              return ('Bet', 0)
-            #Should we 'explore' with a bet??
-            elif random.random() < self.bettingFrequency: #Raise this turn
-              normBet = self.gameBets[index]
-              return self.determineBet(normBet)
-            else: #Continue, but don't bet
-              return ('Bet', 0)
-        elif oppAction == 'Bet':
-          if index > 4 or haveFlush == 1 or haveStraight == 1: #Good chance of winning - match whatever agent wants!
-            return ('Bet', currPhaseBet)
-          elif (index < 5 and haveFlush == -1) or (index < 4 and haveStraight == -1 and haveFlush != 1): 
-            #Too much risk, abort
-            return ('Fold', 0)
-          else: #Less odds of winning
-            if self.maxGameBets[index] < currPhaseBet: #Would bet too much
-              if random.random() < self.gameFoldProb[index]:
-                return ('Fold', 0)
-            return ('Bet', currPhaseBet)
-        else: #Invalid oppAction
-          raise Exception('Invalid oppAction %s' %oppAction)
-
-      print handCards
-      print tableCards
-      print oppPastAction
-      return (None, None) #Error if this reaches here
+      else: #Invalid oppAction
+        raise Exception('Invalid oppAction %s' %oppAction)
 
     def determinePolicy(self, state):
       handCards = self.hand
@@ -906,14 +638,8 @@ class Opponent(object):
         lastAction = (None, 0)
 
       act = None
-      if self.opponentType == 'TAG':
-        act = self.determineTAGPolicy(handCards, tableCards, lastAction)
-      if self.opponentType == 'LAG':
-        act = self.determineLAGPolicy(handCards, tableCards, lastAction)
-      if self.opponentType == 'TPA':
-        act = self.determineTPAPolicy(handCards, tableCards, lastAction)
-      if self.opponentType == 'LPA':
-        act = self.determineLPAPolicy(handCards, tableCards, lastAction)
+      if self.opponentType in OPPONENT_PROFILES:
+        act = self.determineProfilePolicy(handCards, tableCards, lastAction)
       if self.opponentType == 'RANDOM':
         val = random.random()
         if val < 0.2:
@@ -936,66 +662,82 @@ class Opponent(object):
 
   
 
+# Draw detection works on two small ints per set of cards. The rank mask has bit
+# rank - 2 set for every rank present; the suit counts pack the number of cards
+# of each suit into 3 bits per suit. Tables built once at import give the longest
+# straight run of every rank mask and the longest flush of every suit count.
+CARD_RANK_BITS = dict((card, 1 << (rank - 2)) for card, rank in CARD_RANKS.iteritems())
+CARD_SUIT_COUNTS = dict((card, 1 << (3 * suit)) for card, suit in CARD_SUITS.iteritems())
+
+def buildStraightRuns():
+  runs = []
+  for mask in xrange(1 << 13):
+    bits = (mask << 1) | (mask >> 12) #An Ace also counts as the low card below a 2
+    maxLength = 0
+    curLength = 0
+    while bits:
+      if bits & 1:
+        curLength += 1
+        maxLength = max(maxLength, curLength)
+      else:
+        curLength = 0
+      bits >>= 1
+    runs.append(maxLength)
+  return runs
+
+STRAIGHT_RUNS = buildStraightRuns()
+FLUSH_LENGTHS = [max(counts & 7, (counts >> 3) & 7, (counts >> 6) & 7, counts >> 9) for counts in xrange(1 << 12)]
+
+def rankMask(cards):
+  mask = 0
+  for card in cards:
+    mask |= CARD_RANK_BITS[card]
+  return mask
+
+# Counts up to 7 cards of a suit, enough for a hand and the table
+def suitCounts(cards):
+  counts = 0
+  for card in cards:
+    counts += CARD_SUIT_COUNTS[card]
+  return counts
+
 # given a set of cards, function gives the largest number of consecutive cards in set
 def checkStraightLength(cards):
-  cards.sort()
-  #print cards
-  cardRanks = [x[0] for x in cards]
-  rankCounter = collections.Counter(cardRanks)
-  ranks = rankCounter.keys()
-  ranks.sort()
-  maxLength = 1
-  curLength = 1
-  curRank = ranks[0]
-  for i in xrange(1, len(ranks)):
-    if ranks[i] == (curRank + 1):
-      curLength += 1
-      curRank += 1
-      if curLength > maxLength: maxLength = curLength
-    else:
-      curLength = 1
-      curRank = ranks[i]
-  if cards[-1][0] == 14 and 1 not in cardRanks:
-    #Test for Ace case
-    aceLow = (1, cards[-1][1]) #Not normally a valid card; used to model a low ace
-    aceLowCards = cards[0:len(cards)-1]
-    aceLowCards.append(aceLow)
-    aceLowCards.sort()
-    maxLength = max(maxLength, checkStraightLength(aceLowCards))
-  return maxLength
+  return STRAIGHT_RUNS[rankMask(cards)]
 
 def straightAfterFlop(handCards, tableCards):
-  both = checkStraightLength(handCards + tableCards)
-  table = checkStraightLength(tableCards)
+  tableMask = rankMask(tableCards)
+  both = STRAIGHT_RUNS[tableMask | rankMask(handCards)]
+  table = STRAIGHT_RUNS[tableMask]
   return (both > table) and (both >= 3)
 
 def straightAfterTurn(handCards, tableCards):
-  both = checkStraightLength(handCards + tableCards)
-  table = checkStraightLength(tableCards)
+  tableMask = rankMask(tableCards)
+  both = STRAIGHT_RUNS[tableMask | rankMask(handCards)]
+  table = STRAIGHT_RUNS[tableMask]
   if (both > table) and (both >= 4):
     return 1 #You can get a straight
   if table == 4:
     return -1 #You're in danger
   return 0
 
+# given a set of cards, function gives the largest number of cards of one suit
 def checkFlushLength(cards):
-  counter = collections.Counter()
-  for card in cards:
-    suit = card[1]
-    counter[suit] +=1
-  return max(counter.iteritems(), key=operator.itemgetter(1))[1]
+  return FLUSH_LENGTHS[suitCounts(cards)]
 
 def flushAfterFlop(hand, tableCards):
-  both = checkFlushLength(hand + tableCards)
-  table = checkFlushLength(tableCards)
+  tableCounts = suitCounts(tableCards)
+  both = FLUSH_LENGTHS[tableCounts + suitCounts(hand)]
+  table = FLUSH_LENGTHS[tableCounts]
   if (both >= 3 and both > table):
     return True
   else:
     return False
 
 def flushAfterTurn(hand, tableCards):
-  both = checkFlushLength(hand + tableCards)
-  table = checkFlushLength(tableCards)
+  tableCounts = suitCounts(tableCards)
+  both = FLUSH_LENGTHS[tableCounts + suitCounts(hand)]
+  table = FLUSH_LENGTHS[tableCounts]
   if (both >= 4 and both > table):
     return 1
   if table == 4:
@@ -1122,3 +864,58 @@ if agentVal[0] > oppVal[0]:
 '''
     #print computeBaseline(d, t, p1, p2)
 
+
+BASELINE_OUTCOMES = [2, 1, 0, -1, None] #None: computeBaseline's exact ties
+
+# Worker of runBaseline: plays |numDeals| computeBaseline deals with its own
+# deck, table and players and returns the count of every outcome. Module level
+# so that a multiprocessing pool can find it.
+def baselineWorker(args):
+    numDeals, seed = args
+    random.seed(seed) #Forked workers all start from the parent's random state
+    deck = Deck(compact=True)
+    counts = dict((outcome, 0) for outcome in BASELINE_OUTCOMES)
+    for _ in xrange(numDeals):
+        deck.reset(shuffle=False) #computeBaseline shuffles the deck itself
+        counts[computeBaseline(deck, Table(deck), Agent(), Agent())] += 1
+    return counts
+
+# Plays |numDeals| baseline deals on |numWorkers| processes, |chunkDeals| per
+# task. Returns {outcome: (count, fraction, halfWidth)} for every outcome of
+# computeBaseline, where the fraction is within halfWidth of its true value
+# with the confidence of |z| (1.96 for 95%), and the same for 'correct', the
+# deals where the baseline checked a winner or folded a loser (2 or 1).
+def runBaseline(numDeals, numWorkers=None, chunkDeals=100000, seed=0, z=1.96):
+    import multiprocessing
+    rng = random.Random(seed)
+    tasks = [(min(chunkDeals, numDeals - start), rng.getrandbits(32)) for start in xrange(0, numDeals, chunkDeals)]
+    counts = dict((outcome, 0) for outcome in BASELINE_OUTCOMES)
+    pool = multiprocessing.Pool(numWorkers)
+    try:
+        for taskCounts in pool.imap_unordered(baselineWorker, tasks):
+            for outcome, n in taskCounts.iteritems():
+                counts[outcome] += n
+    finally:
+        pool.close()
+        pool.join()
+    counts['correct'] = counts[2] + counts[1]
+
+    results = {}
+    for outcome, n in counts.iteritems():
+        p = float(n) / numDeals
+        results[outcome] = (n, p, z * math.sqrt(p * (1 - p) / numDeals))
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Play computeBaseline deals in parallel.')
+    parser.add_argument('--deals', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk', type=int, default=100000, help='deals per worker task')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = runBaseline(args.deals, args.workers, args.chunk, args.seed)
+    for outcome in BASELINE_OUTCOMES + ['correct']:
+        n, p, halfWidth = results[outcome]
+        print '%-8s %10d  %.4f +- %.4f' %(outcome, n, p, halfWidth)
@@ -1,4 +1,8 @@
-import collections, util, math, random, operator, poker
+import collections, util, math, random, operator, poker, zlib, os, sys
+try:
+    import numpy as np
+except ImportError:
+    np = None #Only needed by HashedQLearningAlgorithm
 
 ############################################################
 
@@ -15,15 +19,12 @@ class QLearningAlgorithm(util.RLAlgorithm):
         self.discount = discount
         self.featureExtractor = featureExtractor
         self.explorationProb = explorationProb
-        self.weights = collections.Counter()
+        self.weights = util.SparseWeights()
         self.numIters = 0
 
     # Return the Q function associated with the weights and features
     def getQ(self, state, action):
-        score = 0
-        for f, v in self.featureExtractor(state, action):
-            score += self.weights[f] * v
-        return score
+        return self.weights.dot(self.featureExtractor(state, action))
 
     # This algorithm will produce an action given a state.
     # Here we use the epsilon-greedy algorithm: with probability
@@ -49,68 +50,342 @@ class QLearningAlgorithm(util.RLAlgorithm):
             x = 0
         else:
             x = max(self.getQ(newState, a) for a in self.actions(newState))
-        r = reward + x*self.discount - self.getQ(state, action)
-        for feature in self.featureExtractor(state, action):
-            if feature[0] in self.weights.keys():
-                self.weights[feature[0]] += self.getStepSize()*r*feature[1]
-            else:
-                self.weights[feature[0]] = self.getStepSize()*r*feature[1]
+        features = self.featureExtractor(state, action)
+        r = reward + x*self.discount - self.weights.dot(features)
+        self.weights.increment(features, self.getStepSize()*r)
 
+    def endEpisode(self):
+        if isinstance(self.featureExtractor, FeatureCache):
+            self.featureExtractor.clear()
+
+    # Weight transfer for parallelSimulate: a copy of the weights to diff against
+    # later, the changes made since such a copy, the average of several workers'
+    # changes, and adding |scale| times some changes to the weights.
+    def copyWeights(self):
+        return dict(self.weights)
+
+    def weightChanges(self, original):
+        changes = {}
+        for f, w in self.weights.iteritems():
+            if w != original.get(f, 0):
+                changes[f] = w - original.get(f, 0)
+        return changes
+
+    def averageWeightChanges(self, changesList):
+        average = util.SparseWeights()
+        for changes in changesList:
+            average.increment(changes.iteritems(), 1.0 / len(changesList))
+        return average
+
+    def addWeightChanges(self, changes, scale=1.0):
+        self.weights.increment(changes.iteritems(), scale)
+
+# Q-learning with a fixed-size weight vector: every (state feature, action) pair is
+# hashed into one of |numBuckets| slots of a NumPy array, so memory does not grow
+# with the number of distinct features, and the legal actions of a state are scored
+# together with one gather-and-sum over a (number of actions) x (number of features)
+# index array.  Needs numpy, and a FeatureCache as |featureExtractor|.
+class HashedQLearningAlgorithm(QLearningAlgorithm):
+    def __init__(self, actions, discount, featureExtractor, explorationProb=0.2, numBuckets=2**20):
+        if np is None:
+            raise Exception('HashedQLearningAlgorithm needs numpy')
+        if numBuckets & (numBuckets - 1):
+            raise Exception('numBuckets must be a power of 2 not %s' %numBuckets)
+        QLearningAlgorithm.__init__(self, actions, discount, featureExtractor, explorationProb)
+        self.numBuckets = numBuckets
+        self.weights = np.zeros(numBuckets)
+        self.stateHashes = {}
+        self.actionHashes = {}
+
+    # Stable across processes and runs, unlike hash(), which depends on the
+    # address of None under Python 2 and feature names contain None
+    def featureHash(self, name):
+        return zlib.crc32(repr(name)) & 0xffffffff
+
+    # Return the legal actions of |state|, the weight indices of the features of
+    # (state, action), one row per action, and the feature values shared by all
+    # the rows.  Computed once per state.
+    def getFeatureIndices(self, state):
+        key = self.featureExtractor.stateKey(state)
+        entry = self.stateHashes.get(key)
+        if entry == None:
+            features = self.featureExtractor.getStateFeatures(state)
+            hashes = np.array([self.featureHash(f) for f, v in features], dtype=np.int64)
+            actions = self.actions(state)
+            actionHashes = []
+            for action in actions:
+                if action not in self.actionHashes:
+                    self.actionHashes[action] = self.featureHash(action)
+                actionHashes.append(self.actionHashes[action])
+            actionHashes = np.array(actionHashes, dtype=np.int64)
+            indices = ((actionHashes[:, None] * 1000003) ^ hashes[None, :]) & (self.numBuckets - 1)
+            entry = (actions, indices, np.array([v for f, v in features]))
+            self.stateHashes[key] = entry
+        return entry
+
+    # Return the legal actions of |state| and their Q values as an array
+    def getQValues(self, state):
+        actions, indices, values = self.getFeatureIndices(state)
+        return actions, (self.weights[indices] * values).sum(axis=1)
+
+    def getQ(self, state, action):
+        actions, q = self.getQValues(state)
+        return q[actions.index(action)]
+
+    def getAction(self, state):
+        self.numIters += 1
+        actions, q = self.getQValues(state)
+        if random.random() < self.explorationProb:
+            return random.choice(actions)
+        else:
+            #Ties go to the largest action, as with QLearningAlgorithm
+            return max(zip(q.tolist(), actions))[1]
+
+    def incorporateFeedback(self, state, action, reward, newState):
+        if newState == None:
+            x = 0
+        else:
+            x = self.getQValues(newState)[1].max()
+        actions, indices, values = self.getFeatureIndices(state)
+        indices = indices[actions.index(action)]
+        r = reward + x*self.discount - (self.weights[indices] * values).sum()
+        np.add.at(self.weights, indices, self.getStepSize()*r*values) #Colliding features add up
+
+    def endEpisode(self):
+        QLearningAlgorithm.endEpisode(self)
+        self.stateHashes.clear()
+
+    # Weight changes are (bucket indices, deltas), without repeated indices
+    def copyWeights(self):
+        return self.weights.copy()
+
+    def weightChanges(self, original):
+        indices = np.flatnonzero(self.weights != original)
+        return (indices, self.weights[indices] - original[indices])
+
+    def averageWeightChanges(self, changesList):
+        indices, inverse = np.unique(np.concatenate([i for i, d in changesList]), return_inverse=True)
+        deltas = np.bincount(inverse, weights=np.concatenate([d for i, d in changesList]), minlength=len(indices))
+        return (indices, deltas / len(changesList))
+
+    def addWeightChanges(self, changes, scale=1.0):
+        indices, deltas = changes
+        self.weights[indices] += scale * deltas
+
+# Q-learning with experience replay on the hashed NumPy model: besides the usual
+# update, every transition is stored and, every |replayEvery| steps, a minibatch
+# of |batchSize| stored transitions is learned from again.  Transitions live in
+# preallocated arrays of |bufferSize| slots (managed by a util.ReplayBuffer) as
+# the weight indices and values of (s, a), the reward and the index matrix of s'
+# for every legal a', since the legal actions of s' depend on the table at the
+# time.  Rows are zero-padded to |maxFeatures| features and |maxActions| actions.
+# A minibatch computes its TD errors with one gather against the weights it
+# started with and applies them with one np.add.at.  With |prioritized|,
+# transitions are replayed in proportion to |TD error| ** |priorityExponent|,
+# and each update is scaled by the importance-sampling weight
+# (N * P(i)) ** -|importanceExponent|, divided by the largest in the batch, which
+# undoes the bias of the skewed sampling (fully at an exponent of 1).
+class ReplayQLearningAlgorithm(HashedQLearningAlgorithm):
+    def __init__(self, actions, discount, featureExtractor, explorationProb=0.2, numBuckets=2**20,
+                 bufferSize=10000, batchSize=32, replayEvery=4, prioritized=False, priorityExponent=0.6,
+                 importanceExponent=0.4, maxFeatures=16, maxActions=5):
+        HashedQLearningAlgorithm.__init__(self, actions, discount, featureExtractor, explorationProb, numBuckets)
+        self.buffer = util.ReplayBuffer(bufferSize, prioritized)
+        self.batchSize = batchSize
+        self.replayEvery = replayEvery
+        self.priorityExponent = priorityExponent
+        self.importanceExponent = importanceExponent
+        self.maxFeatures = maxFeatures
+        self.indices = np.zeros((bufferSize, maxFeatures), dtype=np.int64)
+        self.values = np.zeros((bufferSize, maxFeatures))
+        self.rewards = np.zeros(bufferSize)
+        self.nextIndices = np.zeros((bufferSize, maxActions, maxFeatures), dtype=np.int64)
+        self.nextValues = np.zeros((bufferSize, maxFeatures))
+        self.nextLegal = np.zeros((bufferSize, maxActions), dtype=bool)
+        self.numUpdates = 0
+
+    def incorporateFeedback(self, state, action, reward, newState):
+        HashedQLearningAlgorithm.incorporateFeedback(self, state, action, reward, newState)
+        self.store(state, action, reward, newState)
+        self.numUpdates += 1
+        if self.numUpdates % self.replayEvery == 0:
+            self.replay()
+
+    # Copy a transition into the next slot of the arrays
+    def store(self, state, action, reward, newState):
+        actions, indices, values = self.getFeatureIndices(state)
+        if len(values) > self.maxFeatures:
+            raise Exception('State has %d features, more than maxFeatures %d' %(len(values), self.maxFeatures))
+        i = self.buffer.add()
+        n = len(values)
+        self.indices[i] = 0
+        self.indices[i, :n] = indices[actions.index(action)]
+        self.values[i] = 0
+        self.values[i, :n] = values
+        self.rewards[i] = reward
+        self.nextIndices[i] = 0
+        self.nextValues[i] = 0
+        self.nextLegal[i] = False
+        if newState != None:
+            actions, indices, values = self.getFeatureIndices(newState)
+            if len(values) > self.maxFeatures:
+                raise Exception('State has %d features, more than maxFeatures %d' %(len(values), self.maxFeatures))
+            self.nextIndices[i, :len(actions), :len(values)] = indices
+            self.nextValues[i, :len(values)] = values
+            self.nextLegal[i, :len(actions)] = True
+
+    # Learn from one minibatch of stored transitions
+    def replay(self):
+        slots = np.array(self.buffer.sampleIndices(self.batchSize))
+        weights = self.weights
+        indices = self.indices[slots]
+        values = self.values[slots]
+        legal = self.nextLegal[slots]
+        q = (weights[indices] * values).sum(axis=1)
+        nextQ = (weights[self.nextIndices[slots]] * self.nextValues[slots][:, None, :]).sum(axis=2)
+        x = np.where(legal, nextQ, -np.inf).max(axis=1)
+        x[~legal.any(axis=1)] = 0 #Terminal transitions
+        r = self.rewards[slots] + x*self.discount - q
+        scale = self.getStepSize() / len(slots)
+        if self.buffer.prioritized:
+            buffer = self.buffer
+            probs = np.array([buffer.getPriority(i) for i in slots.tolist()]) / buffer.totalPriority()
+            importance = (len(buffer) * probs) ** -self.importanceExponent
+            scale = scale * importance / importance.max()
+            priorities = (np.abs(r) + 1e-3) ** self.priorityExponent
+            for i, p in zip(slots.tolist(), priorities.tolist()):
+                buffer.setPriority(i, p)
+        #Padding has index 0 and value 0, so it adds nothing
+        np.add.at(weights, indices.ravel(), ((scale * r)[:, None] * values).ravel())
+
+# ReplayQLearningAlgorithm with prioritized replay, so that LEARNERS can name it
+class PrioritizedReplayQLearningAlgorithm(ReplayQLearningAlgorithm):
+    def __init__(self, actions, discount, featureExtractor, explorationProb=0.2, **options):
+        options.setdefault('prioritized', True)
+        ReplayQLearningAlgorithm.__init__(self, actions, discount, featureExtractor, explorationProb, **options)
+
+# Learners testQL, the benchmark and the parallel trainer can build by name
+LEARNERS = collections.OrderedDict([
+    ('linear', QLearningAlgorithm), #Dict weights, the default
+    ('hashed', HashedQLearningAlgorithm), #Feature-hashed NumPy weights
+    ('replay', ReplayQLearningAlgorithm), #Hashed, with experience replay
+    ('prioritized-replay', PrioritizedReplayQLearningAlgorithm),
+])
+
+# Return a new learner of kind |learner| (a key of LEARNERS) for |mdp|
+def makeLearner(learner, mdp, explorationProb=0.2):
+    if learner not in LEARNERS:
+        raise Exception('Unknown learner %s, not one of %s' %(learner, ', '.join(LEARNERS)))
+    return LEARNERS[learner](mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), explorationProb)
+
+# Feature extractor that computes the action-independent features of a state once
+# and reuses them: getAction scores every action of a state and incorporateFeedback
+# scores every action of the next one, which is the state of the next getAction.
+# stateFeatures(state) returns (feature name, feature value) pairs whose names are
+# tuples, completed with the action to make the features of (state, action).
+# stateKey(state) must be hashable and equal for states with equal features.
+# Clear it at the end of every episode.
+class FeatureCache(object):
+    def __init__(self, stateFeatures, stateKey):
+        self.stateFeatures = stateFeatures
+        self.stateKey = stateKey
+        self.cache = {}
+
+    def __call__(self, state, action):
+        return [(f + (action,), v) for f, v in self.getStateFeatures(state)]
+
+    def getStateFeatures(self, state):
+        key = self.stateKey(state)
+        features = self.cache.get(key)
+        if features == None:
+            features = self.stateFeatures(state)
+            self.cache[key] = features
+        return features
+
+    def clear(self):
+        self.cache.clear()
 
 # Feature extractor
 def pokerFeatureExtractor(state, action):
+    return [(f + (action,), v) for f, v in pokerStateFeatures(state)]
+
+# Immutable key for a state, for caching its features
+def pokerStateKey(state):
+    handCards, tableCards, pot, oppAction, isEnd = state
+    return (poker.cardMask(handCards), poker.cardMask(tableCards), pot, oppAction, isEnd)
+
+def cachedPokerFeatureExtractor():
+    return FeatureCache(pokerStateFeatures, pokerStateKey)
+
+# Memo in front of hand assessment for the features. The same hand and table come
+# back many times within an episode (the pot and last action change, the cards
+# don't) and across episodes; the LRU bound keeps memory flat on long runs.
+# The value only depends on all the cards together, up to their suits, so the
+# key is their canonical card mask and every relabelling of the suits, or split
+# of the cards between hand and table, hits the same entry.
+HAND_VALUE_CACHE_SIZE = 200000
+handValueCache = util.LRUCache(HAND_VALUE_CACHE_SIZE)
+
+# Value of the best hand the cards make, as in Agent.assessHand
+def cachedHandValue(handCards, tableCards):
+    key = poker.canonicalMask(poker.cardMask(handCards) | poker.cardMask(tableCards))
+    value = handValueCache.get(key)
+    if value == None:
+        value = poker.assessCards(list(handCards), list(tableCards))[0]
+        handValueCache.put(key, value)
+    return value
+
+# The features of pokerFeatureExtractor without the action
+def pokerStateFeatures(state):
     handCards, tableCards, pot, oppAction, isEnd = state
     featureVector =[]
     featureValue = 1.0
 
-    agent = poker.Agent()
-    agent.hand = handCards
-    
+    handCards = sorted(handCards)
+    tableCards = sorted(tableCards)
     combinedCards = handCards + tableCards
-    combinedCards.sort()
-    handCards.sort()
-    tableCards.sort()
 
     handRanks = []
     tableRanks = []
     for i in range(len(handCards)):
-      handRanks.append(handCards[i][0])
+      handRanks.append(poker.CARD_RANKS[handCards[i]])
     for i in range(len(tableCards)):
-      tableRanks.append(tableCards[i][0])
+      tableRanks.append(poker.CARD_RANKS[tableCards[i]])
     hearts = 0
     spades = 0
     diamonds = 0
     clubs = 0
     for i in range(len(combinedCards)):
-      if combinedCards[i][1] == "Hearts":
+      suit = poker.CODE_SUITS[poker.CARD_SUITS[combinedCards[i]]]
+      if suit == "Hearts":
         hearts += 1
-      elif combinedCards[i][1] == "Spades":
+      elif suit == "Spades":
         spades += 1
-      elif combinedCards[i][1] == "Diamonds":
+      elif suit == "Diamonds":
         diamonds += 1 
-      elif combinedCards[i][1] == "Clubs":
+      elif suit == "Clubs":
         clubs += 1 
 
     #feature: pot value
-    featureVector.append((('pot', pot, action), featureValue))
+    featureVector.append((('pot', pot), featureValue))
     #feature: hand+table cards
     #featureVector.append((('c', tuple(combinedCards), action), featureValue))
     #feature: hand ranks
-    featureVector.append((('h', tuple(handRanks), action), featureValue))
+    featureVector.append((('h', tuple(handRanks)), featureValue))
     #feature: table ranks
-    featureVector.append((('t', tuple(tableRanks), action), featureValue))
+    featureVector.append((('t', tuple(tableRanks)), featureValue))
     #feature: number of suits
     if hearts >= 3:
-      featureVector.append((("Hearts", hearts, action), featureValue))
+      featureVector.append((("Hearts", hearts), featureValue))
     if spades >= 3:
-      featureVector.append((("Spades", spades, action), featureValue))
+      featureVector.append((("Spades", spades), featureValue))
     if diamonds >= 3:
-      featureVector.append((("Diamonds", diamonds, action), featureValue))
+      featureVector.append((("Diamonds", diamonds), featureValue))
     if clubs >= 3:
-      featureVector.append((("Clubs", clubs, action), featureValue))
+      featureVector.append((("Clubs", clubs), featureValue))
     #feature: what you have in hand indicator
     if len(tableCards) != 0:
-        v = agent.assessHand(tableCards)[0]
+        v = cachedHandValue(handCards, tableCards)
         if v >= 180:
           v = 180
         elif v >= 160:
@@ -131,18 +406,466 @@ def pokerFeatureExtractor(state, action):
           v = 20
         else:
           v = 0
-        featureVector.append((('value', v, action),featureValue))
+        featureVector.append((('value', v),featureValue))
     #feature: indicator for every card ?
     #for card in handCards+tableCards:
     #    featureVector.append((card, featureValue))
     #feature: Opponent action and phase - Ben
-    featureVector.append((('oppAct', oppAction, isEnd, action), featureValue))
+    featureVector.append((('oppAct', oppAction, isEnd), featureValue))
     
     return featureVector
 
+# Worker process of parallelSimulate. Keeps |QL|, a copy of the parent's learner,
+# and its own MDP and deck for the whole run. Each round it receives the average
+# of the workers' weight changes in the last round and catches up with the
+# parent by trading its own changes for that average; then it trains and sends
+# back (weight changes, iterations run, rewards). Only changes cross the pipe,
+# never the whole model.
+def trainWorker(conn, QL, oppType, seed):
+    random.seed(seed) #Forked workers all start from the parent's random state
+    deck = poker.Deck(compact=True)
+    mdp = util.pokerMDP(deck, oppType)
+    QL.actions = mdp.actions #The copy still asks the parent's MDP
+    changes = None
+    while True:
+        message = conn.recv()
+        if message == None:
+            break
+        average, numIters, numTrials = message
+        if average != None:
+            QL.addWeightChanges(changes, -1.0)
+            QL.addWeightChanges(average)
+        QL.numIters = numIters
+        original = QL.copyWeights()
+        rewards = util.simulate(mdp, QL, numTrials=numTrials, maxIterations=10000)
+        changes = QL.weightChanges(original)
+        conn.send((changes, QL.numIters - numIters, rewards))
+    conn.close()
+
+# Runs |numTrials| Q-learning trials against |oppType| on |numWorkers| processes
+# and trains |QL| (any learner of LEARNERS) with them. Each worker starts from a
+# copy of |QL|, handed over once when the process forks. The trials go in rounds
+# of |roundTrials| per worker, and at the end of a round |QL| and every worker
+# move to the start weights plus the average of the changes the workers made.
+# Shorter rounds keep the workers closer together at the cost of more messages.
+# Returns the list of rewards of every trial, as util.simulate does.
+def parallelSimulate(QL, oppType, numTrials, numWorkers=None, roundTrials=1000):
+    import multiprocessing
+    if numWorkers == None:
+        numWorkers = multiprocessing.cpu_count()
+    workers = []
+    totalRewards = []
+    try:
+        for i in range(numWorkers):
+            conn, workerConn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=trainWorker, args=(workerConn, QL, oppType, random.getrandbits(32)))
+            process.daemon = True
+            process.start()
+            workers.append((process, conn))
+        average = None
+        trialsLeft = numTrials
+        while trialsLeft > 0:
+            active = []
+            for process, conn in workers:
+                n = min(roundTrials, trialsLeft)
+                if n == 0:
+                    break
+                trialsLeft -= n
+                conn.send((average, QL.numIters, n))
+                active.append(conn)
+            results = [conn.recv() for conn in active]
+            average = QL.averageWeightChanges([changes for changes, numIters, rewards in results])
+            QL.addWeightChanges(average)
+            for changes, numIters, rewards in results:
+                QL.numIters += numIters
+                totalRewards.extend(rewards)
+    finally:
+        for process, conn in workers:
+            try:
+                conn.send(None)
+            except IOError:
+                pass #Worker already gone
+            process.join()
+    return totalRewards
+
+
+#Function to load weight from file.
+#Text in file should be of the format {(feature1): value1, (feature2):value2}
+#A binary weight file (see util.saveWeights) with the same base name and a
+#.weights extension is read instead when there is no text file or the text file
+#is not newer. Otherwise the text is parsed and, as a side effect, converted to
+#that binary file for later runs. A binary file can also be given directly.
+#Loaded weights are kept for when human mode switches back, and for the
+#evaluation workers, which fork after the parent loaded them.
+#Every caller shares the one loaded copy: evaluation and human play only read it.
+loadedWeights = {}
+def loadWeight(fileName):
+    if fileName not in loadedWeights:
+        binaryFileName = os.path.splitext(fileName)[0] + '.weights'
+        if os.path.exists(binaryFileName) and (not os.path.exists(fileName) or
+                os.path.getmtime(binaryFileName) >= os.path.getmtime(fileName)):
+            loadedWeights[fileName] = util.loadWeights(binaryFileName)
+        else:
+            #Writes binaryFileName next to the text file
+            loadedWeights[fileName] = util.SparseWeights(util.convertWeights(fileName, binaryFileName))
+    return loadedWeights[fileName]
+
+# Plays one game of |QL| against |opp| and returns its (outcome, agent utility).
+# With |human| the opponent's actions are read from the keyboard and appended to
+# |humanActions|; otherwise |opp| plays its policy.
+def playGame(QL, mdp, deck, table, agent, opp, human=False, humanActions=None):
+
+    def oppPlay(i,agentAction):
+        oppState = (agent.hand, table.tableCards, table.bettingPot, agentAction, i)
+        if not human:
+            oppAction = opp.determinePolicy(oppState)
+            table.incrementOppBet(oppAction[1])
+            table.appendAction(oppAction)
+            return oppAction
+        else:
+            actions = mdp.actions(oppState)
+            index = input('Type action index:' + str(actions))
+            print 'Your Action: ' + str(actions[index])
+            table.incrementOppBet(actions[index][1])
+            table.appendAction(actions[index])
+            humanActions.append(actions[index])
+            return actions[index]
+    
+    def agentPlay(i, oppAction):
+        agentState = (agent.hand, table.tableCards, table.bettingPot, oppAction, i)
+        agentAction = QL.getAction(agentState)
+        table.incrementAgentBet(agentAction[1])
+        table.appendAction(agentAction)
+        if human:
+          print 'Agent Action: ' + str(agentAction)
+        return agentAction
+
+    def determineFullGameWinner(deck, table, agent, opp):
+      cardsNeeded = 5 - len(table.tableCards)
+      if cardsNeeded > 0:
+        for i in range(cardsNeeded):
+          table.flipCard(deck)
+
+        agentVal = agent.assessHand(table.tableCards)
+        oppVal = opp.assessHand(table.tableCards)
+
+        agentVal = (agentVal[0], sorted(agentVal[1], reverse=True))
+        oppVal = (oppVal[0], sorted(oppVal[1], reverse=True))
+  
+        if agentVal[0] > oppVal[0]:
+          return "Agent"
+        elif agentVal[0] == oppVal[0]:
+          if agentVal[1] > oppVal[1]:
+            return "Agent"
+          elif agentVal[1] < oppVal[1]:
+            return "Opp"
+          return "Tie"
+          return 0
+        return "Opp"
+
+    # shuffle deck
+    deck.shuffle()
+    # deal players
+    #table.dealPlayers(agent,opp,deck)
+    if human:
+      print'Your cards are:' + str(poker.readableCards(opp.hand))
+
+    oppAction = oppPlay(0, (None,0))
+                      
+    if oppAction[0] == 'Fold':
+        agentUtility = table.getOppBet()
+        return ('OppLeft', agentUtility)
+
+    agentAction = agentPlay(1,oppAction)                     
+    if agentAction[0] == 'Fold':
+        if human:
+          print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+          print 'You win: %d' %table.bettingPot
+        agentUtility = -(table.getAgentBet())
+        couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+        if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+          return ('GoodFold', agentUtility)
+        return ('BadFold', agentUtility)
+
+    # in case agent raises
+    if agentAction[1] > oppAction[1]:
+
+        oppAction = oppPlay(2, agentAction)
+        if oppAction[0] == 'Fold':
+          agentUtility = table.getOppBet()
+          return ('OppLeft', agentUtility)
+
+        agentAction = agentPlay(3, oppAction)
+        if agentAction[0] == 'Fold':
+          if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+          agentUtility = -(table.getAgentBet())
+          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+            return ('GoodFold', agentUtility)
+          return ('BadFold', agentUtility)
+  
+    # deal table - flop
+    table.flipCard(deck)
+    table.flipCard(deck)
+    table.flipCard(deck)
+
+    if human:
+        print 'Flop: ' + str(poker.readableCards(table.tableCards))
+        print 'Your cards: ' + str(poker.readableCards(opp.hand))
+        print 'Pot: ' + str(table.bettingPot)
+                      
+    # asses hand
+    oppAction = oppPlay(0, (None,0))
+    if oppAction[0] == 'Fold':
+        agentUtility = table.getOppBet()
+        return ('OppLeft', agentUtility)
+
+    agentAction = agentPlay(1,oppAction)
+    if agentAction[0] == 'Fold':
+        if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+        agentUtility = -(table.getAgentBet())
+        couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+        if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+          return ('GoodFold', agentUtility)
+        return ('BadFold', agentUtility)
+
+    # in case agent raises
+    if agentAction[1] > oppAction[1]:
+
+        oppAction = oppPlay(2, agentAction)
+        if oppAction[0] == 'Fold':
+          agentUtility = table.getOppBet()
+          return ('OppLeft', agentUtility)
+
+        agentAction = agentPlay(3, oppAction)
+        if agentAction[0] == 'Fold':
+          if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+          agentUtility = -(table.getAgentBet())
+          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+            return ('GoodFold', agentUtility)
+          return ('BadFold', agentUtility)
+  
+    # deal table - turn
+    table.flipCard(deck)
+
+    if human:
+        print 'Turn: ' + str(poker.readableCards(table.tableCards))
+        print 'Your cards: ' + str(poker.readableCards(opp.hand))
+        print 'Pot: ' + str(table.bettingPot)
+                      
+    # asses hand
+    oppAction = oppPlay(0, (None,0))
+    if oppAction[0] == 'Fold':
+        agentUtility = table.getOppBet()
+        return ('OppLeft', agentUtility)
+
+    agentAction = agentPlay(1,oppAction)
+    if agentAction[0] == 'Fold':
+        if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+        agentUtility = -(table.getAgentBet())
+        couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+        if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+          return ('GoodFold', agentUtility)
+        return ('BadFold', agentUtility)
+
+    # in case agent raises
+    if agentAction[1] > oppAction[1]:
+
+        oppAction = oppPlay(2, agentAction)
+        if oppAction[0] == 'Fold':
+          agentUtility = table.getOppBet()
+          return ('OppLeft', agentUtility)
+
+        agentAction = agentPlay(3, oppAction)
+        if agentAction[0] == 'Fold':
+          if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+          agentUtility = -(table.getAgentBet())
+          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+            return ('GoodFold', agentUtility)
+          return ('BadFold', agentUtility)
+
+    # deal table - river
+    table.flipCard(deck)
+    if human:
+        print 'River: ' + str(poker.readableCards(table.tableCards))
+        print 'Your cards: ' + str(poker.readableCards(opp.hand))
+        print 'Pot: ' + str(table.bettingPot)
+                      
+    # asses hand
+    oppAction = oppPlay(0, (None,0))
+    if oppAction[0] == 'Fold':
+        agentUtility = table.getOppBet()
+        return ('OppLeft', agentUtility)
+
+    agentAction = agentPlay(1,oppAction)
+    if agentAction[0] == 'Fold':
+        if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+        agentUtility = -(table.getAgentBet())
+        couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+        if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+          return ('GoodFold', agentUtility)
+        return ('BadFold', agentUtility)
+
+    # in case agent raises
+    if agentAction[1] > oppAction[1]:
+
+        oppAction = oppPlay(2, agentAction)
+        if oppAction[0] == 'Fold':
+          agentUtility = table.getOppBet()
+          return ('OppLeft', agentUtility)
+
+        agentAction = agentPlay(3, oppAction)
+        if agentAction[0] == 'Fold':
+          if human:
+            print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+            print 'You win: %d' %table.bettingPot
+          agentUtility = -(table.getAgentBet())
+          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
+          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
+            return ('GoodFold', agentUtility)
+          return ('BadFold', agentUtility)
+
+    agentVal = agent.assessHand(table.tableCards)
+    oppVal = opp.assessHand(table.tableCards)
+
+    agentVal = (agentVal[0], sorted(agentVal[1], reverse=True))
+    oppVal = (oppVal[0], sorted(oppVal[1], reverse=True))
+
+    if human:
+      print 'Agent\'s hand revealed: ' + str(poker.readableCards(agent.hand))
+                      
+    if agentVal[0] > oppVal[0]:
+      if human:
+        print 'You lose ' + str(table.bettingPot)
+      return ('Win', table.getOppBet())
+    elif agentVal[0] == oppVal[0]:
+        if agentVal[1] > oppVal[1]:
+          if human:
+            print 'You lose ' + str(table.bettingPot)
+          return ('Win', table.getOppBet())
+        elif agentVal[1] < oppVal[1]:
+            if human:
+                print 'You win ' + str(table.bettingPot)
+            return ('Lose', -(table.getAgentBet()))
+        return ('Win', 0) #Count ties as a win for simplicity
+    if human:
+        print 'You win ' + str(table.bettingPot)
+    return ('Lose', -(table.getAgentBet()))
+
+
+OPPONENT_TYPES = ['TAG', 'LAG', 'TPA', 'LPA', 'RANDOM']
+
+# Worker of batchEvaluate: plays |numGames| games of the weights in |weightFile|
+# against |oppType|, without exploration, as testQL does. Returns the matchup
+# with the counts of outcomes and of utilities (testQL's stateHistory and
+# utilityHistory). Module level so that a multiprocessing pool can find it.
+def evaluateWorker(args):
+    oppType, weightFile, numGames, seed = args
+    random.seed(seed) #Forked workers all start from the parent's random state
+    deck = poker.Deck(compact=True)
+    mdp = util.pokerMDP(deck, oppType)
+    QL = QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0)
+    QL.weights = loadWeight(weightFile)
+    stateHistory = collections.Counter()
+    utilityHistory = collections.Counter()
+    for _ in xrange(numGames):
+        mdp.startState()
+        state, utility = playGame(QL, mdp, mdp.deck, mdp.table, mdp.agent, mdp.opponent)
+        QL.endEpisode()
+        stateHistory[state] += 1
+        utilityHistory[utility] += 1
+    return oppType, weightFile, stateHistory, utilityHistory
+
+# Plays |numGames| games for every (opponent type, weight file) in |matchups| on
+# |numWorkers| processes, in tasks of |chunkGames| games. As each task finishes,
+# appends a JSON line with the running totals of its matchup to |resultsFile|,
+# so the last line of a matchup is its result and a long run can be followed or
+# cut short. Returns {matchup: (stateHistory, utilityHistory)}.
+def batchEvaluate(matchups, numGames, resultsFile, numWorkers=None, chunkGames=10000, seed=0):
+    import multiprocessing, json
+    if len(set(matchups)) != len(matchups):
+        raise Exception('Duplicate matchups in %s' %(matchups,))
+    for oppType, weightFile in matchups:
+        loadWeight(weightFile) #Converts text weights once, and the workers fork with them loaded
+    rng = random.Random(seed)
+    tasks = []
+    for oppType, weightFile in matchups:
+        for start in xrange(0, numGames, chunkGames):
+            tasks.append((oppType, weightFile, min(chunkGames, numGames - start), rng.getrandbits(32)))
+    totals = {}
+    for matchup in matchups:
+        totals[matchup] = (collections.Counter(), collections.Counter())
+
+    pool = multiprocessing.Pool(numWorkers)
+    try:
+        with open(resultsFile, 'a') as outf:
+            for oppType, weightFile, states, utilities in pool.imap_unordered(evaluateWorker, tasks):
+                stateHistory, utilityHistory = totals[(oppType, weightFile)]
+                stateHistory.update(states)
+                utilityHistory.update(utilities)
+                games = sum(stateHistory.values())
+                totalUtility = sum(u * n for u, n in utilityHistory.iteritems())
+                outf.write(json.dumps({'opponent': oppType, 'weights': weightFile,
+                                       'games': games, 'totalGames': numGames,
+                                       'states': dict(stateHistory),
+                                       'utilities': dict((str(u), n) for u, n in utilityHistory.iteritems()),
+                                       'totalUtility': totalUtility,
+                                       'meanUtility': float(totalUtility) / games}, sort_keys=True) + '\n')
+                outf.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return totals
+
+# Command line of batchEvaluate, for evaluation runs without testQL's prompts
+def evaluateMain(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Evaluate trained weights against opponent types.')
+    parser.add_argument('--opponents', nargs='+', choices=OPPONENT_TYPES, default=OPPONENT_TYPES)
+    parser.add_argument('--weights', nargs='+',
+                        help='one weight file for all opponents or one per opponent (default w_<type>_5k.txt)')
+    parser.add_argument('--games', type=int, default=10000, help='games per opponent')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk', type=int, default=10000, help='games per worker task')
+    parser.add_argument('--output', default='evaluation.jsonl', help='file the running results are appended to')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    weights = args.weights
+    if weights == None:
+        weights = ['w_%s_5k.txt' %oppType.lower() for oppType in args.opponents]
+    elif len(weights) == 1:
+        weights = weights * len(args.opponents)
+    elif len(weights) != len(args.opponents):
+        parser.error('give one weight file, or one per opponent')
+    matchups = zip(args.opponents, weights)
+    if len(set(matchups)) != len(matchups):
+        parser.error('each opponent and weight file pair can only be evaluated once')
+
+    totals = batchEvaluate(matchups, args.games, args.output, args.workers, args.chunk, args.seed)
+    for matchup in matchups:
+        stateHistory, utilityHistory = totals[matchup]
+        print '%s with %s' %matchup
+        print dict(stateHistory)
+        print dict(utilityHistory)
+        print sum(u * n for u, n in utilityHistory.iteritems())
 
 def testQL():
-  deck = poker.Deck()
+  deck = poker.Deck(compact=True)
   deck.shuffle()
   mdp = None
   QL = None
@@ -150,13 +873,6 @@ def testQL():
   oppType = None
   humanActions = []
 
-    #function to load weight from file.
-    #Text in file should be of the format {(feature1): value1, (feature2):value2}
-  def loadWeight(fileName):
-      with open(fileName,'r') as inf:
-          dict_from_file = eval(inf.read())
-      return collections.Counter(dict_from_file)
-
 
   userInput = raw_input('Type S to simulate QLearning, hit Enter otherwise: ')
   if(userInput == 'S' or userInput == 's'):
@@ -182,19 +898,28 @@ def testQL():
       oppType = 'RANDOM'
     
     print 'How many Q-Learning trials do you wish to run?'
-    print 'WARNING: We strongly recommend using 1000 trials or less'
-    print 'In our experience, 1000 gets done in about 10 minutes most cases'
-    print 'Anything over that can take hours'
+    print 'In our experience, 10000 trials get done in a few seconds'
+    print 'and 100000 in about a minute'
     
     userTrial = int(raw_input('Number of trials: '))
     print 'How many tests do you want to run on the generated weight vector?'
     numIter = int(raw_input('Number of tests: '))
+    print 'How many worker processes should train? (1 trains in this process)'
+    numWorkers = int(raw_input('Number of workers: '))
+    print 'Which learner should train?'
+    for i, learner in enumerate(LEARNERS):
+      print '%d. %s' %(i, learner)
+    learner = LEARNERS.keys()[int(raw_input('Learner: '))]
     mdp = util.pokerMDP(deck, oppType)
-    QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+    QL = makeLearner(learner, mdp)
     
-    print util.simulate(mdp, QL, numTrials=userTrial, maxIterations=10000)
+    if numWorkers > 1:
+      print parallelSimulate(QL, oppType, userTrial, numWorkers)
+    else:
+      print util.simulate(mdp, QL, numTrials=userTrial, maxIterations=10000)
     print QL.weights
     print 'Weight length: %d' %len(QL.weights)
+    print 'Hand value cache: %d hits, %d misses' %(handValueCache.hits, handValueCache.misses)
   else:
     human = True
     print 'What type of opponent weight-vector do you wish to start with?'
@@ -210,35 +935,35 @@ def testQL():
       
       oppType = 'TAG'
       mdp = util.pokerMDP(deck, oppType)
-      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0.2)
       QL.weights = loadWeight('w_tag_5k.txt')
     
     elif userInput == 1:
       
       oppType = 'LAG'
       mdp = util.pokerMDP(deck, oppType)
-      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0.2)
       QL.weights = loadWeight('w_lag_5k.txt')
     
     elif userInput == 2:
       
       oppType = 'TPA'
       mdp = util.pokerMDP(deck, oppType)
-      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0.2)
       QL.weights = loadWeight('w_tpa_5k.txt')
     
     elif userInput == 3:
       
       oppType = 'LPA'
       mdp = util.pokerMDP(deck, oppType)
-      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0.2)
       QL.weights = loadWeight('w_lpa_5k.txt')
     
     elif userInput == 4:
       
       oppType = 'RANDOM'
       mdp = util.pokerMDP(deck, oppType)
-      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+      QL= QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0.2)
       QL.weights = loadWeight('w_random_5k.txt')
     
     print 'How many games do you wish to play?'
@@ -278,258 +1003,6 @@ def testQL():
       else :
         return 'LPA'
   
-  def playGame(QL, deck, table, agent, opp, human):
-
-      def oppPlay(i,agentAction):
-          oppState = (agent.hand, table.tableCards, table.bettingPot, agentAction, i)
-          if not human:
-              oppAction = opp.determinePolicy(oppState)
-              table.incrementOppBet(oppAction[1])
-              table.appendAction(oppAction)
-              return oppAction
-          else:
-              actions = mdp.actions(oppState)
-              index = input('Type action index:' + str(actions))
-              print 'Your Action: ' + str(actions[index])
-              table.incrementOppBet(actions[index][1])
-              table.appendAction(actions[index])
-              humanActions.append(actions[index])
-              return actions[index]
-      
-      def agentPlay(i, oppAction):
-          agentState = (agent.hand, table.tableCards, table.bettingPot, oppAction, i)
-          agentAction = QL.getAction(agentState)
-          table.incrementAgentBet(agentAction[1])
-          table.appendAction(agentAction)
-          if human:
-            print 'Agent Action: ' + str(agentAction)
-          return agentAction
-
-      def determineFullGameWinner(deck, table, agent, opp):
-        cardsNeeded = 5 - len(table.tableCards)
-        if cardsNeeded > 0:
-          for i in range(cardsNeeded):
-            table.flipCard(deck)
-
-          agentVal = agent.assessHand(table.tableCards)
-          oppVal = opp.assessHand(table.tableCards)
-
-          agentVal = (agentVal[0], sorted(agentVal[1], reverse=True))
-          oppVal = (oppVal[0], sorted(oppVal[1], reverse=True))
-    
-          if agentVal[0] > oppVal[0]:
-            return "Agent"
-          elif agentVal[0] == oppVal[0]:
-            if agentVal[1] > oppVal[1]:
-              return "Agent"
-            elif agentVal[1] < oppVal[1]:
-              return "Opp"
-            return "Tie"
-            return 0
-          return "Opp"
-
-      # shuffle deck
-      deck.shuffle()
-      # deal players
-      #table.dealPlayers(agent,opp,deck)
-      if human:
-        print'Your cards are:' + str(opp.hand)
-
-      oppAction = oppPlay(0, (None,0))
-                        
-      if oppAction[0] == 'Fold':
-          agentUtility = table.getOppBet()
-          return ('OppLeft', agentUtility)
-
-      agentAction = agentPlay(1,oppAction)                     
-      if agentAction[0] == 'Fold':
-          if human:
-            print 'Agent\'s hand revealed: ' + str(agent.hand)
-            print 'You win: %d' %table.bettingPot
-          agentUtility = -(table.getAgentBet())
-          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-            return ('GoodFold', agentUtility)
-          return ('BadFold', agentUtility)
-
-      # in case agent raises
-      if agentAction[1] > oppAction[1]:
-
-          oppAction = oppPlay(2, agentAction)
-          if oppAction[0] == 'Fold':
-            agentUtility = table.getOppBet()
-            return ('OppLeft', agentUtility)
-
-          agentAction = agentPlay(3, oppAction)
-          if agentAction[0] == 'Fold':
-            if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-            agentUtility = -(table.getAgentBet())
-            couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-            if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-              return ('GoodFold', agentUtility)
-            return ('BadFold', agentUtility)
-    
-      # deal table - flop
-      table.flipCard(deck)
-      table.flipCard(deck)
-      table.flipCard(deck)
-
-      if human:
-          print 'Flop: ' + str(table.tableCards)
-          print 'Your cards: ' + str(opp.hand)
-          print 'Pot: ' + str(table.bettingPot)
-                        
-      # asses hand
-      oppAction = oppPlay(0, (None,0))
-      if oppAction[0] == 'Fold':
-          agentUtility = table.getOppBet()
-          return ('OppLeft', agentUtility)
-
-      agentAction = agentPlay(1,oppAction)
-      if agentAction[0] == 'Fold':
-          if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-          agentUtility = -(table.getAgentBet())
-          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-            return ('GoodFold', agentUtility)
-          return ('BadFold', agentUtility)
-
-      # in case agent raises
-      if agentAction[1] > oppAction[1]:
-
-          oppAction = oppPlay(2, agentAction)
-          if oppAction[0] == 'Fold':
-            agentUtility = table.getOppBet()
-            return ('OppLeft', agentUtility)
-
-          agentAction = agentPlay(3, oppAction)
-          if agentAction[0] == 'Fold':
-            if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-            agentUtility = -(table.getAgentBet())
-            couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-            if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-              return ('GoodFold', agentUtility)
-            return ('BadFold', agentUtility)
-    
-      # deal table - turn
-      table.flipCard(deck)
-
-      if human:
-          print 'Turn: ' + str(table.tableCards)
-          print 'Your cards: ' + str(opp.hand)
-          print 'Pot: ' + str(table.bettingPot)
-                        
-      # asses hand
-      oppAction = oppPlay(0, (None,0))
-      if oppAction[0] == 'Fold':
-          agentUtility = table.getOppBet()
-          return ('OppLeft', agentUtility)
-
-      agentAction = agentPlay(1,oppAction)
-      if agentAction[0] == 'Fold':
-          if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-          agentUtility = -(table.getAgentBet())
-          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-            return ('GoodFold', agentUtility)
-          return ('BadFold', agentUtility)
-
-      # in case agent raises
-      if agentAction[1] > oppAction[1]:
-
-          oppAction = oppPlay(2, agentAction)
-          if oppAction[0] == 'Fold':
-            agentUtility = table.getOppBet()
-            return ('OppLeft', agentUtility)
-
-          agentAction = agentPlay(3, oppAction)
-          if agentAction[0] == 'Fold':
-            if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-            agentUtility = -(table.getAgentBet())
-            couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-            if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-              return ('GoodFold', agentUtility)
-            return ('BadFold', agentUtility)
-
-      # deal table - river
-      table.flipCard(deck)
-      if human:
-          print 'River: ' + str(table.tableCards)
-          print 'Your cards: ' + str(opp.hand)
-          print 'Pot: ' + str(table.bettingPot)
-                        
-      # asses hand
-      oppAction = oppPlay(0, (None,0))
-      if oppAction[0] == 'Fold':
-          agentUtility = table.getOppBet()
-          return ('OppLeft', agentUtility)
-
-      agentAction = agentPlay(1,oppAction)
-      if agentAction[0] == 'Fold':
-          if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-          agentUtility = -(table.getAgentBet())
-          couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-          if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-            return ('GoodFold', agentUtility)
-          return ('BadFold', agentUtility)
-
-      # in case agent raises
-      if agentAction[1] > oppAction[1]:
-
-          oppAction = oppPlay(2, agentAction)
-          if oppAction[0] == 'Fold':
-            agentUtility = table.getOppBet()
-            return ('OppLeft', agentUtility)
-
-          agentAction = agentPlay(3, oppAction)
-          if agentAction[0] == 'Fold':
-            if human:
-              print 'Agent\'s hand revealed: ' + str(agent.hand)
-              print 'You win: %d' %table.bettingPot
-            agentUtility = -(table.getAgentBet())
-            couldHaveWon = determineFullGameWinner(deck, table, agent, opp)
-            if couldHaveWon == "Agent" or couldHaveWon == "Tie":
-              return ('GoodFold', agentUtility)
-            return ('BadFold', agentUtility)
-
-      agentVal = agent.assessHand(table.tableCards)
-      oppVal = opp.assessHand(table.tableCards)
-
-      agentVal = (agentVal[0], sorted(agentVal[1], reverse=True))
-      oppVal = (oppVal[0], sorted(oppVal[1], reverse=True))
-
-      if human:
-        print 'Agent\'s hand revealed: ' + str(agent.hand)
-                        
-      if agentVal[0] > oppVal[0]:
-        if human:
-          print 'You lose ' + str(table.bettingPot)
-        return ('Win', table.getOppBet())
-      elif agentVal[0] == oppVal[0]:
-          if agentVal[1] > oppVal[1]:
-            if human:
-              print 'You lose ' + str(table.bettingPot)
-            return ('Win', table.getOppBet())
-          elif agentVal[1] < oppVal[1]:
-              if human:
-                  print 'You win ' + str(table.bettingPot)
-              return ('Lose', -(table.getAgentBet()))
-          return ('Win', 0) #Count ties as a win for simplicity
-      if human:
-          print 'You win ' + str(table.bettingPot)
-      return ('Lose', -(table.getAgentBet()))
 
 
   agent = poker.Agent()
@@ -544,7 +1017,8 @@ def testQL():
     mdp.startState()
     if human:
       mdp.table.bettingPot = 0 #Make sure starting pot is zero
-    result = playGame(QL, mdp.deck, mdp.table, mdp.agent, mdp.opponent, human)
+    result = playGame(QL, mdp, mdp.deck, mdp.table, mdp.agent, mdp.opponent, human, humanActions)
+    QL.endEpisode()
     state, utility = result[0], result[1]
     if state in stateHistory:
       stateHistory[state] += 1
@@ -569,7 +1043,7 @@ def testQL():
           print 'Loading %s weight vector' %newOppType
           oppType = newOppType
           mdp = util.pokerMDP(deck, oppType)
-          QL= QLearningAlgorithm(mdp.actions, mdp.discount(), pokerFeatureExtractor, 0.2)
+          QL= QLearningAlgorithm(mdp.actions, mdp.discount(), cachedPokerFeatureExtractor(), 0.2)
           if newOppType == 'TAG':
             QL.weights = loadWeight('w_tag_5k.txt')
           elif newOppType == 'LAG':
@@ -578,21 +1052,25 @@ def testQL():
             QL.weights = loadWeight('w_tpa_5k.txt')
           else: #'LPA'
             QL.weights = loadWeight('w_lpa_5k.txt')
-    deck.reset()
     agent = poker.Agent() #Easy way to reset agent, opp, table
     opp = poker.Opponent(oppType)
     table = poker.Table(mdp.deck)
   return stateHistory, utilityHistory
 
 
-states, utilities = testQL()
-print 'Agent Summary'
-print states
-print utilities
-summate = 0
-for key in utilities.keys():
-    summate += key*utilities[key]
-print summate
+# With arguments, runs batchEvaluate (see evaluateMain); otherwise the prompts of testQL
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        evaluateMain(sys.argv[1:])
+    else:
+        states, utilities = testQL()
+        print 'Agent Summary'
+        print states
+        print utilities
+        summate = 0
+        for key in utilities.keys():
+            summate += key*utilities[key]
+        print summate
 
 '''
 deck = poker.Deck()
@@ -1,4 +1,4 @@
-import collections, random
+import collections, random, itertools, bisect, struct, array, marshal, mmap, sys, gc, timeit
 import poker
 
 # An abstract class representing a Markov Decision Process (MDP).
@@ -16,6 +16,17 @@ class MDP:
     # If IsEnd(state), return the empty list.
     def succAndProbReward(self, state, action): raise NotImplementedError("Override me")
 
+    # Return a single (newState, reward) pair drawn from the distribution given by
+    # succAndProbReward, or None if IsEnd(state).  simulate() uses this, so MDPs
+    # that can draw a successor directly should override it rather than build
+    # every successor only to keep one.
+    def sampleSuccAndReward(self, state, action):
+        transitions = self.succAndProbReward(state, action)
+        if len(transitions) == 0:
+            return None
+        newState, prob, reward = transitions[sample([prob for newState, prob, reward in transitions])]
+        return (newState, reward)
+
     def discount(self): raise NotImplementedError("Override me")
 
     # Compute set of states reachable from startState.  Helper function for
@@ -48,6 +59,188 @@ class MDPAlgorithm:
 
 ############################################################
 
+# Sparse weight vector for linear function approximation: a dict from feature name
+# to weight. Missing features read as 0 without being inserted, as with
+# collections.Counter, and a whole feature vector is scored or updated in one call.
+class SparseWeights(dict):
+    def __missing__(self, feature):
+        return 0
+
+    # Return the dot product with a list of (feature name, feature value) pairs.
+    def dot(self, features):
+        get = self.get
+        score = 0
+        for f, v in features:
+            score += get(f, 0) * v
+        return score
+
+    # Add |scale| times the value of each (feature name, feature value) pair to
+    # the weight of that feature.
+    def increment(self, features, scale):
+        get = self.get
+        for f, v in features:
+            self[f] = get(f, 0) + scale * v
+
+# Binary weight files: a header (WEIGHT_FILE_HEADER: magic, version, number of
+# features, length of the feature table), the feature names as one marshal'ed
+# list, zero padding to a multiple of 8 bytes, then the weights as little-endian
+# doubles in the same order as the names.  Feature names are the tuples of
+# strings, ints, floats and None the extractors build, which marshal reads back
+# at C speed, unlike the eval of a text dump.
+WEIGHT_FILE_MAGIC = 'PQW\x00'
+WEIGHT_FILE_VERSION = 1
+WEIGHT_FILE_HEADER = struct.Struct('<4sIQQ')
+
+def saveWeights(weights, fileName):
+    names = list(weights.iterkeys())
+    values = array.array('d', [weights[f] for f in names])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    table = marshal.dumps(names)
+    with open(fileName, 'wb') as outf:
+        outf.write(WEIGHT_FILE_HEADER.pack(WEIGHT_FILE_MAGIC, WEIGHT_FILE_VERSION, len(names), len(table)))
+        outf.write(table)
+        outf.write('\x00' * (-(WEIGHT_FILE_HEADER.size + len(table)) % 8))
+        values.tofile(outf)
+
+# Return the weights stored by saveWeights as a SparseWeights.  Much faster than
+# parsing the text dump, but still linear in the model: every name and value
+# becomes a Python object, ~1.8s for 2M features.
+def loadWeights(fileName):
+    with open(fileName, 'rb') as inf:
+        data = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    gcEnabled = gc.isenabled()
+    gc.disable() #Building millions of tuples would set off collection after collection
+    try:
+        magic, version, count, tableLength = WEIGHT_FILE_HEADER.unpack_from(data)
+        if magic != WEIGHT_FILE_MAGIC or version != WEIGHT_FILE_VERSION:
+            raise Exception('%s is not a version %d weight file' %(fileName, WEIGHT_FILE_VERSION))
+        start = WEIGHT_FILE_HEADER.size
+        names = marshal.loads(data[start:start + tableLength])
+        start += tableLength + (-(start + tableLength) % 8)
+        values = array.array('d')
+        values.fromstring(data[start:start + 8 * count])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        if len(names) != count or len(values) != count:
+            raise Exception('%s is truncated' %fileName)
+        return SparseWeights(itertools.izip(names, values))
+    finally:
+        data.close()
+        if gcEnabled:
+            gc.enable()
+
+# Converts a text dump of a weight dict ({feature1: value1, ...}, optionally
+# wrapped in Counter(...)) to a binary weight file.
+def convertWeights(textFileName, fileName):
+    with open(textFileName, 'r') as inf:
+        weights = eval(inf.read(), {'Counter': collections.Counter})
+    saveWeights(weights, fileName)
+    return weights
+
+############################################################
+
+# Memo holding at most |maxSize| entries: once full, storing a new key evicts the
+# least recently used one.  |hits| and |misses| count the outcomes of get().
+class LRUCache:
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Return the value stored for |key|, or None if there is none.
+    def get(self, key):
+        value = self.entries.pop(key, None)
+        if value == None:
+            self.misses += 1
+            return None
+        self.entries[key] = value #Back to the most recently used end
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+############################################################
+
+# Slot allocation and sampling for experience replay.  The transitions themselves
+# live in the learner's preallocated arrays, indexed by slot; slots are reused in
+# a ring, so once full each new transition overwrites the oldest.  With
+# |prioritized| a slot is drawn with probability proportional to its priority
+# (kept in a sum tree, O(log capacity) per draw or update); otherwise uniformly.
+# New transitions get the highest priority seen so far, so each one is likely to
+# be replayed at least once.
+class ReplayBuffer:
+    def __init__(self, capacity, prioritized=False):
+        self.capacity = capacity
+        self.position = 0
+        self.size = 0
+        self.prioritized = prioritized
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = [0.0] * (2 * self.leaves) if prioritized else None
+        self.maxPriority = 1.0
+
+    # Return the slot for a new transition
+    def add(self):
+        i = self.position
+        if self.prioritized:
+            self.setPriority(i, self.maxPriority)
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    # Return a list of |batchSize| slot indices, drawn with replacement
+    def sampleIndices(self, batchSize):
+        if not self.prioritized:
+            size = self.size
+            return [int(random.random() * size) for _ in xrange(batchSize)]
+        tree = self.tree
+        indices = []
+        for _ in xrange(batchSize):
+            target = random.random() * tree[1]
+            node = 1
+            while node < self.leaves:
+                node *= 2
+                if target >= tree[node] and tree[node + 1] > 0:
+                    target -= tree[node]
+                    node += 1
+            indices.append(node - self.leaves)
+        return indices
+
+    def getPriority(self, i):
+        return self.tree[i + self.leaves]
+
+    def totalPriority(self):
+        return self.tree[1]
+
+    def setPriority(self, i, priority):
+        if priority > self.maxPriority:
+            self.maxPriority = priority
+        node = i + self.leaves
+        change = priority - self.tree[node]
+        while node >= 1:
+            self.tree[node] += change
+            node //= 2
+
+    def __len__(self):
+        return self.size
+
+############################################################
+
 # Abstract class: an RLAlgorithm performs reinforcement learning.  All it needs
 # to know is the set of available actions to take.  The simulator (see
 # simulate()) will call getAction() to get an action, perform the action, and
@@ -65,24 +258,147 @@ class RLAlgorithm:
     # |newState|.
     def incorporateFeedback(self, state, action, reward, newState): raise NotImplementedError("Override me")
 
+    # Called at the end of every trial, so anything kept for the current episode
+    # only can be dropped.
+    def endEpisode(self): pass
+
 ############################################################
 
+# Draws i in [0, ..., len(probs)-1] with probability probs[i].  Build it once per
+# distribution (O(n)); each draw() then bisects the cumulative probabilities in
+# O(log n), or takes O(1) when all the probabilities are equal, as they are when
+# drawing any one of the cards left in the deck.
+class Sampler:
+    def __init__(self, probs):
+        self.size = len(probs)
+        self.uniform = self.size > 0 and min(probs) == max(probs)
+        self.cumulative = []
+        accum = 0
+        for prob in probs:
+            accum += prob
+            self.cumulative.append(accum)
+        if self.size == 0 or accum < 1 - 1e-6:
+            raise Exception("Invalid probs: %s" % probs)
+
+    def draw(self):
+        target = random.random()
+        if self.uniform:
+            return int(target * self.size)
+        return min(bisect.bisect_left(self.cumulative, target), self.size - 1)
+
+# Return i in [0, ..., len(probs)-1] with probability probs[i].
+def sample(probs):
+    return Sampler(probs).draw()
+
+# Accumulates the time spent in each phase of a simulation and the number of
+# calls to it. Phases nest (feature extraction inside the weight update, hand
+# evaluation inside the opponent policy): while an inner phase runs, the outer
+# one is paused, so each second is counted under exactly one phase.
+# Python 2 has no monotonic clock; |timer| defaults to the best one available.
+class PhaseProfiler:
+    def __init__(self, timer=timeit.default_timer):
+        self.timer = timer
+        self.totals = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.stack = []
+        self.numHands = 0
+        self.startTime = timer()
+
+    def enter(self, phase):
+        now = self.timer()
+        if self.stack:
+            outer = self.stack[-1]
+            self.totals[outer[0]] += now - outer[1]
+        self.stack.append([phase, now])
+        self.calls[phase] += 1
+
+    def exit(self):
+        now = self.timer()
+        phase, since = self.stack.pop()
+        self.totals[phase] += now - since
+        if self.stack:
+            self.stack[-1][1] = now
+
+    # Return |fn| timed as |phase|
+    def wrap(self, phase, fn):
+        def timed(*args):
+            self.enter(phase)
+            try:
+                return fn(*args)
+            finally:
+                self.exit()
+        return timed
+
+    # Time |phase| as |obj.attr|, an instance attribute or method. Returns a
+    # function that puts the original back.
+    def instrument(self, obj, attr, phase):
+        missing = object()
+        original = obj.__dict__.get(attr, missing)
+        setattr(obj, attr, self.wrap(phase, getattr(obj, attr)))
+        def restore():
+            if original is missing:
+                del obj.__dict__[attr]
+            else:
+                setattr(obj, attr, original)
+        return restore
+
+    # Return a table of the total, per-hand average, calls and share of the
+    # elapsed time of every phase; 'other' is the time outside all of them.
+    def report(self):
+        elapsed = self.timer() - self.startTime
+        totals = dict(self.totals)
+        totals['other'] = max(0.0, elapsed - sum(totals.values()))
+        hands = max(1, self.numHands)
+        lines = ['Profile after %d hands, %.2fs' %(self.numHands, elapsed),
+                 '%-20s %10s %12s %10s %7s' %('phase', 'total s', 'ms/hand', 'calls', '%')]
+        for phase, total in sorted(totals.iteritems(), key=lambda item: -item[1]):
+            lines.append('%-20s %10.3f %12.4f %10d %6.1f%%' %(phase, total, 1000 * total / hands,
+                         self.calls.get(phase, 0), 100 * total / elapsed if elapsed > 0 else 0))
+        return '\n'.join(lines)
+
+# Time the phases of simulate on |mdp| and |rl| with |profiler|. Returns a
+# function that removes the instrumentation again. 'hand evaluation' times
+# poker.assessCards wherever it is called: both players' assessHand, and the
+# hand-value cache misses of the features, whose time leaves 'feature extraction'.
+def instrumentSimulation(profiler, mdp, rl):
+    restores = [profiler.instrument(rl, 'getAction', 'action selection'),
+                profiler.instrument(rl, 'incorporateFeedback', 'weight update')]
+    # Behind a FeatureCache only the misses compute features
+    extractor = rl.featureExtractor
+    if hasattr(extractor, 'stateFeatures'):
+        restores.append(profiler.instrument(extractor, 'stateFeatures', 'feature extraction'))
+    else:
+        restores.append(profiler.instrument(rl, 'featureExtractor', 'feature extraction'))
+    if hasattr(mdp, 'successors'):
+        restores.append(profiler.instrument(mdp, 'successors', 'transitions'))
+    restores.append(profiler.instrument(mdp, 'startState', 'deal'))
+    restores.append(profiler.instrument(poker, 'assessCards', 'hand evaluation'))
+    if hasattr(mdp, 'profiler'):
+        mdp.profiler = profiler
+    def restore():
+        for r in restores:
+            r()
+        if hasattr(mdp, 'profiler'):
+            mdp.profiler = None
+    return restore
+
 # Perform |numTrials| of the following:
 # On each trial, take the MDP |mdp| and an RLAlgorithm |rl| and simulates the
 # RL algorithm according to the dynamics of the MDP.
 # Each trial will run for at most |maxIterations|.
+# With |sampled|, each step draws one successor through mdp.sampleSuccAndReward;
+# otherwise (or with |sort|) it builds the full succAndProbReward distribution.
+# |cacheSamplers| reuses one Sampler per size for uniform distributions, such as
+# the deck draws, which a uniform Sampler handles from their size alone; other
+# distributions still get a new Sampler.
+# With a PhaseProfiler |profiler|, times every phase of the run and prints its
+# report at the end, and every |profileEvery| trials if that is given.
 # Return the list of rewards that we get for each trial.
 def simulate(mdp, rl, numTrials=10, maxIterations=1000, verbose=False,
-             sort=False):
-    # Return i in [0, ..., len(probs)-1] with probability probs[i].
-    def sample(probs):
-        target = random.random()
-        accum = 0
-        for i, prob in enumerate(probs):
-            accum += prob
-            if accum >= target: return i
-        raise Exception("Invalid probs: %s" % probs)
-
+             sort=False, sampled=True, cacheSamplers=False, profiler=None, profileEvery=None):
+    samplers = {}
+    if profiler != None:
+        restore = instrumentSimulation(profiler, mdp, rl)
     totalRewards = []  # The rewards we get on each trial
     outputProgress = maxIterations / 100
     for trial in range(numTrials):
@@ -95,15 +411,28 @@ def simulate(mdp, rl, numTrials=10, maxIterations=1000, verbose=False,
         totalReward = 0
         for _ in range(maxIterations):
             action = rl.getAction(state)
-            transitions = mdp.succAndProbReward(state, action)
-            if sort: transitions = sorted(transitions)
-            if len(transitions) == 0:
-                rl.incorporateFeedback(state, action, 0, None)
-                break
-
-            # Choose a random transition
-            i = sample([prob for newState, prob, reward in transitions])
-            newState, prob, reward = transitions[i]
+            if sampled and not sort:
+                outcome = mdp.sampleSuccAndReward(state, action)
+                if outcome == None:
+                    rl.incorporateFeedback(state, action, 0, None)
+                    break
+                newState, reward = outcome
+            else:
+                transitions = mdp.succAndProbReward(state, action)
+                if sort: transitions = sorted(transitions)
+                if len(transitions) == 0:
+                    rl.incorporateFeedback(state, action, 0, None)
+                    break
+
+                # Choose a random transition
+                probs = [prob for newState, prob, reward in transitions]
+                if cacheSamplers and probs.count(probs[0]) == len(probs):
+                    sampler = samplers.get(len(probs))
+                    if sampler == None:
+                        sampler = samplers[len(probs)] = Sampler(probs)
+                else:
+                    sampler = Sampler(probs)
+                newState, prob, reward = transitions[sampler.draw()]
             sequence.append(action)
             sequence.append(reward)
             sequence.append(newState)
@@ -112,9 +441,17 @@ def simulate(mdp, rl, numTrials=10, maxIterations=1000, verbose=False,
             totalReward += totalDiscount * reward
             totalDiscount *= mdp.discount()
             state = newState
+        rl.endEpisode()
         if verbose:
             print "Trial %d (totalReward = %s): %s" % (trial, totalReward, sequence)
         totalRewards.append(totalReward)
+        if profiler != None:
+            profiler.numHands += 1
+            if profileEvery and (trial + 1) % profileEvery == 0 and trial + 1 < numTrials:
+                print profiler.report()
+    if profiler != None:
+        restore()
+        print profiler.report()
     return totalRewards
 
 ################CONSTANTS###################
@@ -134,6 +471,7 @@ class pokerMDP(MDP):
         self.opponent = None
         self.deck = deck
         self.oppType = oppType
+        self.profiler = None #Set by simulate when it profiles the run
     # Return the start state.
     # Look at this function to learn about the state representation.
     # The first element of the tuple is the sum of the cards in the player's
@@ -145,12 +483,13 @@ class pokerMDP(MDP):
     def startState(self):
         
         self.deck.reset()
-        self.deck.shuffle()
         table = poker.Table(self.deck)
         self.table = table
         opp = poker.Opponent(self.oppType)
         self.opponent = opp
         self.agent = poker.Agent()
+        if self.profiler != None:
+            self.profiler.instrument(opp, 'determinePolicy', 'opponent policy')
         table.dealPlayers(self.agent, self.opponent, self.deck)
         state = (self.agent.hand, [], 0, (None, 0), 0)
         firstAction = opp.determinePolicy(state)
@@ -190,6 +529,20 @@ class pokerMDP(MDP):
     # coming out of |state|.  Indicate a terminal state
     # by setting the IsEnd indicator to 4.
     def succAndProbReward(self, state, action):
+        return self.successors(state, action, False)
+
+    # Play one step of the actual game: new table cards are drawn from the deck
+    # instead of enumerated, so the cost no longer depends on the deck size.
+    def sampleSuccAndReward(self, state, action):
+        transitions = self.successors(state, action, True)
+        if len(transitions) == 0:
+            return None
+        newState, prob, reward = transitions[0]
+        return (newState, reward)
+
+    # Shared by succAndProbReward and sampleSuccAndReward. With |drawCards| a chance
+    # node deals its cards from the deck and yields that single successor.
+    def successors(self, state, action, drawCards):
         ans = []
         history = self.table.getActionHistory()
         if state[4] == 4:
@@ -206,11 +559,16 @@ class pokerMDP(MDP):
         if len(state[1]) == 3 or len(state[1]) == 4 :
             stateForOpp = (state[0], state[1], state[2], action, state[4])
             oppAction = self.opponent.determinePolicy(stateForOpp)
-            if state[4] == 2 or state[4] == 3:
-                for card in self.deck.cards:
+            if (state[4] == 2 or state[4] == 3) and drawCards:
+                s = list(state[1])
+                s.append(self.deck.draw())
+                ans.append(((state[0], s, state[2] + action[1], oppAction, (state[4]+2) % 4), 1, 0))
+            elif state[4] == 2 or state[4] == 3:
+                remaining = self.deck.remainingCards()
+                for card in remaining:
                     s = list(state[1])
                     s.append(card)
-                    p = 1.0 / len(self.deck.cards)
+                    p = 1.0 / len(remaining)
                     ans.append(((state[0], s, state[2] + action[1], oppAction, (state[4]+2) % 4), p, 0)) # need to actually draw those cards
                 self.deck.draw()
             else:
@@ -224,19 +582,15 @@ class pokerMDP(MDP):
         if len(state[1]) < 3:
             stateForOpp = (state[0], state[1], state[2], action, state[4])
             oppAction = self.opponent.determinePolicy(stateForOpp)
-            if state[4] == 2 or state[4] == 3:
-                for card1 in self.deck.cards:
-                    for card2 in self.deck.cards:
-                        if card2 != card1:
-                            for card3 in self.deck.cards:
-                                if card3 != card2 and card3 != card1:
-                                    s = list(state[1])
-                                    s.append(card1)
-                                    s.append(card2)
-                                    s.append(card3)
-                                    L = len(self.deck.cards)
-                                    p = 1.0 / (L*(L-1)*(L-2))
-                                    ans.append(((state[0], s, state[2] + action[1], oppAction, (state[4]+2) % 4), p, 0)) 
+            if (state[4] == 2 or state[4] == 3) and drawCards:
+                s = list(state[1])
+                s.append(self.deck.draw())
+                s.append(self.deck.draw())
+                s.append(self.deck.draw())
+                ans.append(((state[0], s, state[2] + action[1], oppAction, (state[4]+2) % 4), 1, 0))
+            elif state[4] == 2 or state[4] == 3:
+                for s, p in self.flopOutcomes(state[0], state[1]):
+                    ans.append(((state[0], s, state[2] + action[1], oppAction, (state[4]+2) % 4), p, 0))
                 self.deck.draw()
                 self.deck.draw()
                 self.deck.draw()
@@ -278,6 +632,40 @@ class pokerMDP(MDP):
             self.table.incrementAgentBet(action[1])
             return ans
         
+    # Return the distinct flops the deck can deal as a list of (tableCards, prob).
+    # Flops are unordered, and flops that are the same up to relabelling suits
+    # (keeping both players' hands fixed) are merged into one outcome that carries
+    # their summed probability: ~110k ordered draws become a few thousand outcomes.
+    def flopOutcomes(self, handCards, tableCards):
+        remaining = sorted(self.deck.remainingCards())
+        cardSuits = [poker.CARD_SUITS[card] for card in remaining]
+        cardRanks = [poker.CARD_RANKS[card] for card in remaining]
+        oppCards = self.opponent.hand if self.opponent != None else []
+        # Per suit: ranks the agent holds with the table, a 0 separator, the
+        # opponent's ranks, another 0, then the ranks the flop adds
+        agentRanks = [[], [], [], []]
+        for card in sorted(handCards + tableCards):
+            agentRanks[poker.CARD_SUITS[card]].append(poker.CARD_RANKS[card])
+        oppRanks = [[], [], [], []]
+        for card in sorted(oppCards):
+            oppRanks[poker.CARD_SUITS[card]].append(poker.CARD_RANKS[card])
+        handSignatures = [tuple(agentRanks[s]) + (0,) + tuple(oppRanks[s]) + (0,) for s in range(4)]
+
+        counts = {}
+        outcomes = []
+        for combo in itertools.combinations(xrange(len(remaining)), 3):
+            signatures = list(handSignatures)
+            for i in combo:
+                signatures[cardSuits[i]] += (cardRanks[i],)
+            key = tuple(sorted(signatures))
+            if key in counts:
+                counts[key] += 1
+            else:
+                counts[key] = 1
+                outcomes.append((key, combo))
+        total = float(sum(counts.itervalues()))
+        return [(list(tableCards) + [remaining[i] for i in combo], counts[key] / total) for key, combo in outcomes]
+
     def discount(self):
         return 1
 